@@ -1,7 +1,7 @@
 import base64
+import hmac
 import logging
 import os
-import sys
 import uuid
 from logging.handlers import RotatingFileHandler
 import requests
@@ -9,18 +9,55 @@ import json
 import random
 import pandas as pd
 from dotenv import load_dotenv
-from flask import Flask, abort, render_template, request, send_from_directory, jsonify, Response, send_file
+from flask import Flask, abort, g, render_template, request, send_from_directory, jsonify, Response, send_file
 from flask_cors import CORS
 from collections import defaultdict
+from functools import wraps
 import psycopg2
 from linebot.exceptions import InvalidSignatureError
-from linebot.v3.messaging import ApiClient, Configuration, MessagingApi
 from rec_veg.rec_veg import VegetablePredictor
 from nutri_rec.nutri_rec import (
     get_top_vegetables_by_nutrient,
     get_vegetables_by_name_or_alias,
 )
+from nutri_query import (
+    NutrientQueryError,
+    get_nutrient_table,
+    is_compound_query,
+    query_vegetables_by_conditions,
+)
+from recipe_index import RecipeIndex
+from recipe_search import clamp_paging, search_recipes
+from line_sender import LineMessageSender
+from event_dedup import EventDeduplicator, MemoryEventStore, PostgresEventStore
+from metrics import (
+    DB_CONNECT_LATENCY,
+    LOG_RECORDS_DROPPED,
+    MINIO_FETCH_LATENCY,
+    MODEL_INFERENCE_LATENCY,
+    MODEL_INFERENCES,
+    REQUEST_LATENCY,
+    TimedCursor,
+    observe_line_delivery,
+    render_metrics,
+    stage,
+)
+from profiling import RequestProfiler, render_profile_text
+from user_state import PostgresUserStatePersistence, UserStateStore
+try:
+    import columnar
+except ImportError:
+    # 未安裝 pyarrow：/api/datasets 回 503，營養成分查詢退回讀 CSV
+    columnar = None
+from structured_logging import (
+    configure_logging,
+    correlation_id_var,
+    new_correlation_id,
+    redact_payload,
+    reset_correlation_id,
+)
 import io
+import time
 import boto3
 from linebot.v3.messaging.models import (
     CameraAction,
@@ -36,7 +73,6 @@ from linebot.v3.messaging.models import (
     MessageAction,
     QuickReply,
     QuickReplyItem,
-    ReplyMessageRequest,
     TextMessage,
     URIAction,
     PostbackAction,
@@ -72,18 +108,118 @@ def veg_search(veg_id):
 
 
 # ============= logger ===============
-# 設定日誌等級為 INFO，只記錄以上等級的訊息。
-# 移除原本 logger 的所有 handler，避免重複輸出。
-# 新增一個 StreamHandler，將日誌輸出到 sys.stdout（通常是終端機）。
-# 設定日誌格式，包含時間、logger 名稱、等級、訊息。
-# handler 加回 logger
-app.logger.setLevel(logging.INFO)
-for handler in app.logger.handlers:
+# 所有日誌（含各模組的 logger）經由 root logger 的非阻塞佇列輸出成 JSON，見 structured_logging.py。
+# 移除 app.logger 原本的 handler，讓它往 root 傳遞，避免重複輸出。
+# 佇列滿時丟棄的筆數記在 vegebot_log_records_dropped_total
+log_queue_handler = configure_logging(on_drop=LOG_RECORDS_DROPPED.inc)
+for handler in list(app.logger.handlers):
     app.logger.removeHandler(handler)
-handler = logging.StreamHandler(sys.stdout)
-formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-handler.setFormatter(formatter)
-app.logger.addHandler(handler)
+app.logger.setLevel(os.getenv("LOG_LEVEL", "INFO"))
+
+
+# 每個 HTTP 請求一個 correlation id；呼叫端帶 X-Request-ID 時沿用
+@app.before_request
+def _bind_correlation_id():
+    g.correlation_token = new_correlation_id(request.headers.get("X-Request-ID"))
+
+
+@app.after_request
+def _expose_correlation_id(response):
+    response.headers["X-Request-ID"] = correlation_id_var.get() or ""
+    return response
+
+
+@app.teardown_request
+def _unbind_correlation_id(exc):
+    token = g.pop("correlation_token", None)
+    if token is not None:
+        reset_correlation_id(token)
+
+
+# ============= metrics ===============
+# 每個請求依 route 樣板（而非實際網址）記錄延遲，避免 label 數量爆增
+@app.before_request
+def _start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def _observe_request_latency(response):
+    start = getattr(g, "request_start", None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        REQUEST_LATENCY.labels(request.method, route, response.status_code).observe(
+            time.perf_counter() - start
+        )
+    return response
+
+
+# 取樣 profiler，預設關閉；PROFILE_SAMPLE_RATE 或 /api/admin/profiling 可開啟
+profiler = RequestProfiler(app)
+
+
+def _require_admin():
+    """admin API 需要在 header 帶 X-Admin-Token；未設定 ADMIN_TOKEN 時一律拒絕"""
+    admin_token = os.getenv("ADMIN_TOKEN")
+    provided = request.headers.get("X-Admin-Token", "")
+    # 固定時間比較，避免從回應時間逐字猜出 token
+    if not admin_token or not hmac.compare_digest(provided.encode("utf-8"), admin_token.encode("utf-8")):
+        abort(403)
+
+
+@app.route("/api/admin/profiling", methods=["GET", "POST"])
+def admin_profiling():
+    """
+    GET：目前設定、時間視窗內的熱點函式與最近存下的慢請求 profile。
+         可帶 window（秒，不超過設定的 window_seconds）、limit、route 參數。
+    POST：調整 {"sample_rate": 0.05, "slow_ms": 800, "window_seconds": 600}，sample_rate=0 即關閉。
+          設定經由 PROFILE_DIR/settings.json 套用到所有 worker。
+    hot_functions 與 counts 只統計處理這個請求的 worker（回應中的 pid）。
+    """
+    _require_admin()
+    if request.method == "POST":
+        data = request.get_json(silent=True) or {}
+        try:
+            profiler.configure(
+                sample_rate=data.get("sample_rate"),
+                slow_ms=data.get("slow_ms"),
+                window_seconds=data.get("window_seconds"),
+            )
+        except (TypeError, ValueError):
+            return jsonify({"error": "參數格式錯誤"}), 400
+        return jsonify(profiler.status())
+
+    try:
+        limit = int(request.args.get("limit", 20))
+        window = int(request.args["window"]) if "window" in request.args else None
+    except ValueError:
+        return jsonify({"error": "limit 與 window 必須是整數"}), 400
+    return jsonify({
+        "status": profiler.status(),
+        "hot_functions": profiler.hot_functions(
+            limit=limit, window_seconds=window, route=request.args.get("route")
+        ),
+        "slow_profiles": profiler.slow_profiles(),
+    })
+
+
+@app.route("/api/admin/profiling/<filename>", methods=["GET"])
+def admin_profile_detail(filename):
+    """以文字報表檢視某個存下來的慢請求 profile"""
+    _require_admin()
+    path = os.path.join(profiler.profile_dir, os.path.basename(filename))
+    if not filename.endswith(".prof") or not os.path.exists(path):
+        return jsonify({"error": "找不到 profile"}), 404
+    sort = request.args.get("sort", "cumulative")
+    if sort not in ("cumulative", "tottime", "calls"):
+        return jsonify({"error": "sort 只能是 cumulative、tottime 或 calls"}), 400
+    return Response(render_profile_text(path, sort=sort), mimetype="text/plain")
+
+
+@app.route("/metrics")
+def metrics():
+    body, content_type = render_metrics()
+    return Response(body, mimetype=content_type)
 
 
 # 日誌中啟動追蹤：辨識是否有成功匯入
@@ -126,14 +262,20 @@ UNIT_ABBREVIATION_TO_CHINESE = {
 # ============= 連線資料庫 ===============
 def get_db_connection():
     try:
-        conn = psycopg2.connect(
-            host=os.getenv("DATABASE_HOST"),
-            database=os.getenv("DATABASE_NAME"),
-            user=os.getenv("DATABASE_USER"),
-            password=os.getenv("DATABASE_PASSWORD"),
-            port=os.getenv("DATABASE_PORT"),
+        # TimedCursor 會把每次查詢的耗時記到 metrics
+        with DB_CONNECT_LATENCY.time():
+            conn = psycopg2.connect(
+                host=os.getenv("DATABASE_HOST"),
+                database=os.getenv("DATABASE_NAME"),
+                user=os.getenv("DATABASE_USER"),
+                password=os.getenv("DATABASE_PASSWORD"),
+                port=os.getenv("DATABASE_PORT"),
+                cursor_factory=TimedCursor,
+            )
+        app.logger.debug(
+            "Connecting to database at %s:%s/%s",
+            os.getenv("DATABASE_HOST"), os.getenv("DATABASE_PORT"), os.getenv("DATABASE_NAME"),
         )
-        app.logger.info(f"Connecting to database at {os.getenv('DATABASE_HOST')}:{os.getenv('DATABASE_PORT')}/{os.getenv('DATABASE_NAME')}")
         return conn
     except Exception as e:
         app.logger.error(f"Database connection failed: {e}")
@@ -248,6 +390,39 @@ def get_vegetable_detail(veg_id):
 
 
 
+def _group_recipe_rows(rows):
+    """把 (recipe_id, 標題, step_no, 步驟說明) 的查詢結果依食譜合併，步驟串成一段文字"""
+    # 使用 defaultdict 處理資料，確保資料結構正確
+    recipes_map = defaultdict(lambda: {
+        'id': None,
+        'title': '',
+        'steps': []
+    })
+
+    for row in rows:
+        recipe_id = row[0]
+        if recipes_map[recipe_id]['id'] is None:
+            recipes_map[recipe_id]['id'] = row[0]
+            recipes_map[recipe_id]['title'] = row[1]
+
+        recipes_map[recipe_id]['steps'].append({
+            'step_no': row[2],
+            'description': row[3]
+        })
+
+    # 將步驟合併為一個單一的字串，並新增預設圖片網址
+    recipes_list = []
+    for recipe_data in recipes_map.values():
+        steps_text = '\n'.join([f"步驟{s['step_no']}. {s['description']}" for s in recipe_data['steps']])
+        recipes_list.append({
+            'id': recipe_data['id'],
+            'title': recipe_data['title'],
+            'instructions': steps_text,
+            'imageUrl': f'https://dummyimage.com/600x400/80c96a/fff&text={recipe_data["title"]}'
+        })
+    return recipes_list
+
+
 @app.route('/api/recipes/<int:veg_id>', methods=['GET'])
 def get_recipes(veg_id):
     conn = get_db_connection()
@@ -273,36 +448,7 @@ def get_recipes(veg_id):
         if not rows:
             return jsonify({'message': '查無此蔬菜的食譜'}), 200 # 200 表示成功但無資料
 
-        # 使用 defaultdict 處理資料，確保資料結構正確
-        recipes_map = defaultdict(lambda: {
-            'id': None,
-            'title': '',
-            'steps': []
-        })
-
-        for row in rows:
-            # 透過 cursor.description 取得欄位名稱，更安全
-            recipe_id = row[0]
-            if recipes_map[recipe_id]['id'] is None:
-                recipes_map[recipe_id]['id'] = row[0]
-                recipes_map[recipe_id]['title'] = row[1]
-            
-            recipes_map[recipe_id]['steps'].append({
-                'step_no': row[2],
-                'description': row[3]
-            })
-
-        # 將步驟合併為一個單一的字串，並新增預設圖片網址
-        recipes_list = []
-        for recipe_data in recipes_map.values():
-            steps_text = '\n'.join([f"步驟{s['step_no']}. {s['description']}" for s in recipe_data['steps']])
-            recipes_list.append({
-                'id': recipe_data['id'],
-                'title': recipe_data['title'],
-                'instructions': steps_text,
-                'imageUrl': f'https://dummyimage.com/600x400/80c96a/fff&text={recipe_data["title"]}'
-            })
-            
+        recipes_list = _group_recipe_rows(rows)
         return jsonify(recipes_list)
 
     except Exception as e:
@@ -358,6 +504,14 @@ def get_recipes_by_vege_id(vege_id):
             
     return recipes_data
 
+# 食材 → 食譜反向索引，啟動時建立；查詢前 ensure_fresh() 會重試失敗的建立並定期比對食譜內容
+recipe_index = RecipeIndex(
+    get_db_connection,
+    check_interval=int(os.getenv("RECIPE_INDEX_CHECK_SECONDS", 300)),
+    retry_interval=int(os.getenv("RECIPE_INDEX_RETRY_SECONDS", 30)),
+)
+
+
 def create_recipe_flex_carousel(recipes_data):
     """根據食譜資料建立 Flex Carousel"""
     if not recipes_data:
@@ -544,31 +698,80 @@ app.logger.info(
     f"LINE_CHANNEL_ACCESS_TOKEN loaded (length: {len(LINE_CHANNEL_ACCESS_TOKEN)})"
 )
 app.logger.info(f"LINE_CHANNEL_SECRET loaded (length: {len(LINE_CHANNEL_SECRET)})")
-configuration = Configuration(access_token=LINE_CHANNEL_ACCESS_TOKEN)
-api_client = ApiClient(configuration)
-messaging_api = MessagingApi(api_client)
+# 壓力測試時可指向本機的 LINE API 替身（見 loadtest/）
+LINE_API_HOST = os.getenv("LINE_API_HOST", "https://api.line.me")
+LINE_DATA_API_HOST = os.getenv("LINE_DATA_API_HOST", "https://api-data.line.me")
+
+# 回覆訊息交給背景 worker 送出（共用連線池、失敗重試、必要時改用 push）
+line_sender = LineMessageSender(
+    LINE_CHANNEL_ACCESS_TOKEN, host=LINE_API_HOST, on_delivered=observe_line_delivery
+)
 handler = WebhookHandler(LINE_CHANNEL_SECRET)
 
+# LINE 逾時重送的事件只處理一次；多 worker 需要 WEBHOOK_DEDUP_BACKEND=postgres 共用紀錄
+# （以 gunicorn.conf.py 啟動且 workers > 1 時預設就是 postgres）
+WEBHOOK_DEDUP_TTL = int(os.getenv("WEBHOOK_DEDUP_TTL", 600))
+if os.getenv("WEBHOOK_DEDUP_BACKEND", "memory") == "postgres":
+    event_store = PostgresEventStore(get_db_connection, ttl=WEBHOOK_DEDUP_TTL)
+else:
+    event_store = MemoryEventStore(ttl=WEBHOOK_DEDUP_TTL)
+event_deduplicator = EventDeduplicator(event_store)
+
+# 每位使用者最後辨識/查詢的蔬菜與圖片辨識限流；USER_STATE_BACKEND=postgres 時持久化
+# （以 gunicorn.conf.py 啟動且 workers > 1 時預設就是 postgres，「食譜」被分到別的 worker 也查得到）
+user_states = UserStateStore(
+    max_users=int(os.getenv("USER_STATE_MAX_USERS", 10000)),
+    ttl=int(os.getenv("USER_STATE_TTL", 86400)),
+    image_burst=int(os.getenv("IMAGE_RATE_BURST", 3)),
+    image_per_minute=float(os.getenv("IMAGE_RATE_PER_MINUTE", 6)),
+    persistence=PostgresUserStatePersistence(get_db_connection)
+    if os.getenv("USER_STATE_BACKEND", "memory") == "postgres"
+    else None,
+)
+# 這些訊息沿用上一次辨識/查詢到的蔬菜查食譜
+RECIPE_FOLLOW_UP_TEXTS = {"食譜", "相關食譜", "查食譜", "查看相關食譜", "怎麼煮"}
+
+
+def _user_id(event):
+    source = getattr(event, "source", None)
+    return getattr(source, "user_id", None) if source is not None else None
+
 @app.route("/callback", methods=["POST"])
 def callback():
     signature = request.headers["X-Line-Signature"]
     body = request.get_data(as_text=True)
-    app.logger.info("Request body: " + body)
-    app.logger.info("Request signature: " + signature)
+    # body 只在 DEBUG（且經取樣）時記錄，並遮蔽 replyToken / userId、截斷長度；簽章不寫入日誌。
+    # 先判斷層級，INFO 以上時不必對整個 body 跑遮蔽用的 regex
+    if app.logger.isEnabledFor(logging.DEBUG):
+        app.logger.debug("Webhook received", extra={"body": redact_payload(body), "body_length": len(body)})
     try:
         handler.handle(body, signature)
     except InvalidSignatureError:
-        app.logger.error("Invalid signature. Request body: " + body)
+        app.logger.warning(
+            "Invalid signature", extra={"body": redact_payload(body, limit=256), "body_length": len(body)}
+        )
         abort(400)
     except Exception as e:
-        import traceback
-        app.logger.error(f"Unhandled exception in callback: {e}")
-        app.logger.error(traceback.format_exc())
+        app.logger.exception(f"Unhandled exception in callback: {e}")
         abort(500)
     return "OK"
 
+
+def with_event_context(func):
+    """handler 執行期間以 webhookEventId 作為 correlation id，同一事件的日誌可串起來"""
+    @wraps(func)
+    def wrapper(event):
+        token = new_correlation_id(getattr(event, "webhook_event_id", None))
+        try:
+            return func(event)
+        finally:
+            reset_correlation_id(token)
+    return wrapper
+
 # 新增 PostbackEvent 處理
 @handler.add(PostbackEvent)
+@with_event_context
+@event_deduplicator.deduplicated
 def handle_postback(event):
     data = event.postback.data
     app.logger.info(f"Received postback data: {data}")
@@ -580,69 +783,78 @@ def handle_postback(event):
             params = dict(param.split('=') for param in data.split('&'))
             veg_id = int(params.get('veg_id'))
         except (ValueError, KeyError):
-            messaging_api.reply_message(
-                ReplyMessageRequest(
-                    reply_token=event.reply_token,
-                    messages=[TextMessage(text="食譜查詢參數錯誤。")]
-                )
-            )
+            line_sender.reply(event, [TextMessage(text="食譜查詢參數錯誤。")])
             return
 
+        user_states.remember_vegetable(_user_id(event), None, veg_id)
+
         # 查詢食譜
         recipes = get_recipes_by_vege_id(veg_id)
         
         # 建立回覆訊息
         if recipes:
             flex_message = create_recipe_flex_carousel(recipes)
-            messaging_api.reply_message(
-                ReplyMessageRequest(
-                    reply_token=event.reply_token,
-                    messages=[flex_message]
-                )
-            )
+            line_sender.reply(event, [flex_message])
         else:
-            messaging_api.reply_message(
-                ReplyMessageRequest(
-                    reply_token=event.reply_token,
-                    messages=[TextMessage(text="找不到相關食譜喔！")]
+            line_sender.reply(event, [TextMessage(text="找不到相關食譜喔！")])
+
+
+def _parse_recognition_result(recognition_result):
+    """解析 rec_veg 回傳的「預測類別：X\n信心度：Y%」，回傳 (蔬菜名稱, 0~1 的信心度)"""
+    veg_name = "未知蔬菜"
+    confidence = 0.0
+    try:
+        lines = recognition_result.split("\n")
+        if len(lines) >= 2:
+            if "預測類別：" in lines[0]:
+                veg_name = lines[0].replace("預測類別：", "").strip()
+            if "信心度：" in lines[1]:
+                confidence_str = (
+                    lines[1].replace("信心度：", "").replace("%", "").strip()
                 )
-            )
+                confidence = float(confidence_str) / 100.0
+    except Exception as e:
+        app.logger.exception(f"解析 recognition_result 失敗: {e}")
+        veg_name = "未知蔬菜"
+        confidence = 0.0
+    return veg_name, confidence
+
 
 @handler.add(MessageEvent, message=ImageMessageContent)
+@with_event_context
+@event_deduplicator.deduplicated
 def handle_image_message(event):
-    app.logger.info("進入 handle_image_message 函數 ")
+    app.logger.info("進入 handle_image_message 函數", extra={"message_id": event.message.id})
+    # 同一位使用者短時間內大量傳圖時不下載、不推論，直接請他稍候
+    allowed, retry_after = user_states.allow_image(_user_id(event))
+    if not allowed:
+        line_sender.reply(event, [
+            TextMessage(text=f"照片有點多，我還在努力看～ 請 {max(1, round(retry_after))} 秒後再傳一張喔！")
+        ])
+        return
     image_filename = f"temp_image_{uuid.uuid4()}.jpg"
     try:
         # ... (下載圖片和辨識的程式碼不變)
         headers = {"Authorization": f"Bearer {LINE_CHANNEL_ACCESS_TOKEN}"}
-        url = f"https://api-data.line.me/v2/bot/message/{event.message.id}/content"
-        response = requests.get(url, headers=headers, stream=True)
-        if response.status_code != 200:
-            raise Exception(f"圖片下載失敗，狀態碼：{response.status_code}")
-        with open(image_filename, "wb") as f:
-            for chunk in response.iter_content():
-                f.write(chunk)
-        with open(image_filename, "rb") as image_file:
-            encoded_string = base64.b64encode(image_file.read()).decode("utf-8")
-        recognition_result = rec_veg(encoded_string)
-        veg_name = "未知蔬菜"
-        confidence = 0.0
-        try:
-            lines = recognition_result.split("\n")
-            if len(lines) >= 2:
-                if "預測類別：" in lines[0]:
-                    veg_name = lines[0].replace("預測類別：", "").strip()
-                if "信心度：" in lines[1]:
-                    confidence_str = (
-                        lines[1].replace("信心度：", "").replace("%", "").strip()
-                    )
-                    confidence = float(confidence_str) / 100.0
-        except Exception as e:
-            app.logger.error(f"解析 recognition_result 失敗: {e}")
-            import traceback
-            app.logger.error(traceback.format_exc())
-            veg_name = "未知蔬菜"
-            confidence = 0.0
+        url = f"{LINE_DATA_API_HOST}/v2/bot/message/{event.message.id}/content"
+        with stage("image", "download"):
+            response = requests.get(url, headers=headers, stream=True)
+            if response.status_code != 200:
+                raise Exception(f"圖片下載失敗，狀態碼：{response.status_code}")
+            with open(image_filename, "wb") as f:
+                for chunk in response.iter_content():
+                    f.write(chunk)
+        with stage("image", "decode"):
+            with open(image_filename, "rb") as image_file:
+                encoded_string = base64.b64encode(image_file.read()).decode("utf-8")
+        with stage("image", "inference"), MODEL_INFERENCE_LATENCY.labels("line").time():
+            try:
+                recognition_result = rec_veg(encoded_string)
+            except Exception:
+                MODEL_INFERENCES.labels("line", "error").inc()
+                raise
+        MODEL_INFERENCES.labels("line", "ok").inc()
+        veg_name, confidence = _parse_recognition_result(recognition_result)
         prefix_message_text = ""
         if confidence >= 0.8:
             prefix_message_text = f'哼哼 根據我的判斷 它就是"{veg_name}"!!'
@@ -656,7 +868,8 @@ def handle_image_message(event):
             prefix_message_text += f"\n我有{confidence*100:.0f}%的信心"
 
         # 這裡的調用已移除 MinIO 檔案名稱參數
-        vegetable_details = get_vegetables_by_name_or_alias(veg_name)
+        with stage("image", "db_lookup"):
+            vegetable_details = get_vegetables_by_name_or_alias(veg_name)
         
         messages_to_reply = [TextMessage(text=prefix_message_text)]
         if (
@@ -664,42 +877,40 @@ def handle_image_message(event):
             and vegetable_details
             and not isinstance(vegetable_details, str)
         ):
-            flex_message = _create_vegetable_flex_message(
-                vegetable_details, f"辨識結果：{veg_name}"
-            )
+            with stage("image", "flex_build"):
+                flex_message = _create_vegetable_flex_message(
+                    vegetable_details, f"辨識結果：{veg_name}"
+                )
             if flex_message:
                 messages_to_reply.append(flex_message)
+            first_match = vegetable_details[0] if isinstance(vegetable_details, list) else {}
+            user_states.remember_vegetable(
+                _user_id(event), veg_name, first_match.get("id") or first_match.get("vege_id")
+            )
         elif confidence < 0.5:
             pass
         else:
             messages_to_reply.append(TextMessage(text="未能找到該蔬菜的詳細資訊。"))
-        messaging_api.reply_message(
-            ReplyMessageRequest(
-                reply_token=event.reply_token, messages=messages_to_reply
-            )
-        )
-        app.logger.info("Image recognition reply sent successfully.")
+        # 這裡只是放進發送佇列；實際送出時間見 vegebot_line_send_duration_seconds
+        with stage("image", "reply_enqueue"):
+            line_sender.reply(event, messages_to_reply)
+        app.logger.info("Image recognition reply queued.")
     except Exception as e:
-        import traceback
-        app.logger.info(traceback.format_exc())
-        messaging_api.reply_message(
-            ReplyMessageRequest(
-                reply_token=event.reply_token,
-                messages=[
-                    TextMessage(text=f"圖片處理失敗：{e}")
-                ],
-            )
-        )
+        app.logger.exception(f"圖片處理失敗: {e}")
+        line_sender.reply(event, [TextMessage(text=f"圖片處理失敗：{e}")])
     finally:
         if os.path.exists(image_filename):
             os.remove(image_filename)
 
 @handler.add(MessageEvent, message=TextMessageContent)
+@with_event_context
+@event_deduplicator.deduplicated
 def handle_text_message(event):
-    print(f"Received text: {event.message.text}")
+    app.logger.info("Received text", extra={"text": redact_payload(event.message.text, limit=200)})
     try:
         reply_message = None
         text = event.message.text.strip()
+        recipe_index.ensure_fresh()
 
         if text == "上傳圖片":
             reply_message = TextMessage(
@@ -715,13 +926,52 @@ def handle_text_message(event):
             reply_message = TextMessage(
                 text="請輸入您想查詢的營養成分，例如：蛋白質、維生素C、鐵質\n您也可以輸入蔬菜名稱或別名，例如：高麗菜、大白菜"
             )
+        elif text == "輸入現有食材":
+            reply_message = TextMessage(
+                text="請輸入您現有的食材，以空白或逗號分隔，例如：\n食材：高麗菜 蒜頭 紅蘿蔔"
+            )
+        elif text in RECIPE_FOLLOW_UP_TEXTS:
+            state = user_states.get(_user_id(event))
+            if state is not None and state.last_vege_id:
+                recipes = get_recipes_by_vege_id(state.last_vege_id)
+                if recipes:
+                    reply_message = create_recipe_flex_carousel(recipes)
+                else:
+                    reply_message = TextMessage(text=f"找不到{state.last_vege_name or '這個蔬菜'}的相關食譜喔！")
+            else:
+                reply_message = TextMessage(text="請先上傳蔬菜照片或輸入蔬菜名稱，我再幫您找食譜！")
+        elif recipe_index.is_ingredient_list(text):
+            ingredients, unknown = recipe_index.resolve_ingredients(text)
+            matched_recipes = recipe_index.search(ingredients)
+            if matched_recipes:
+                reply_message = create_recipe_flex_carousel(matched_recipes)
+            elif unknown and not ingredients:
+                reply_message = TextMessage(text=f"無法辨識這些食材：{'、'.join(unknown)}")
+            else:
+                reply_message = TextMessage(text="找不到使用這些食材的食譜喔！")
+        elif is_compound_query(text):
+            # 多條件查詢，例如「高蛋白 低鈉」、「鐵質>2 且 熱量<20」
+            condition_result = query_vegetables_by_conditions(text)
+            if condition_result:
+                reply_message = _create_vegetable_flex_message(
+                    condition_result,
+                    f"符合 {text} 條件",
+                    is_nutrient_search=True,
+                )
+            else:
+                reply_message = TextMessage(text="沒有蔬菜同時符合這些條件，請試著放寬條件。")
         else:
             nutrient_input = text
-            print(f"DEBUG: Processing nutrient input: '{nutrient_input}'")
+            app.logger.debug("Processing nutrient input: '%s'", nutrient_input)
 
             # 這裡的調用已移除 MinIO 檔案名稱參數
             recommendation_result = get_top_vegetables_by_nutrient(nutrient_input)
-            print(f"DEBUG: Recommendation result for '{nutrient_input}': {recommendation_result}")
+            if app.logger.isEnabledFor(logging.DEBUG):
+                app.logger.debug(
+                    "Recommendation result for '%s'",
+                    nutrient_input,
+                    extra={"result_count": len(recommendation_result) if isinstance(recommendation_result, list) else 0},
+                )
             
             if recommendation_result and isinstance(recommendation_result, list):
                 valid_vegetables = []
@@ -739,12 +989,17 @@ def handle_text_message(event):
                         is_nutrient_search=True,
                     )
                 else:
-                    print(f"DEBUG: No valid data found for '{nutrient_input}' after filtering.")
+                    app.logger.debug("No valid data found for '%s' after filtering.", nutrient_input)
             
             if not reply_message:
                 # 這裡的調用已移除 MinIO 檔案名稱參數
                 vegetable_search_result = get_vegetables_by_name_or_alias(nutrient_input)
-                print(f"DEBUG: Vegetable search result for '{nutrient_input}': {vegetable_search_result}")
+                if app.logger.isEnabledFor(logging.DEBUG):
+                    app.logger.debug(
+                        "Vegetable search result for '%s'",
+                        nutrient_input,
+                        extra={"result_count": len(vegetable_search_result) if isinstance(vegetable_search_result, list) else 0},
+                    )
 
                 if vegetable_search_result and isinstance(vegetable_search_result, list):
                     limited_vegetable_search_result = vegetable_search_result[:12]
@@ -761,21 +1016,149 @@ def handle_text_message(event):
                             valid_vegetables,
                             f"為您推薦 {nutrient_input} 相關蔬菜",
                         )
+                        user_states.remember_vegetable(
+                            _user_id(event), valid_vegetables[0]["chinese_name"], valid_vegetables[0]["id"]
+                        )
                     else:
-                        print(f"DEBUG: No valid data found for '{nutrient_input}' after filtering.")
+                        app.logger.debug("No valid data found for '%s' after filtering.", nutrient_input)
             
             if not reply_message:
                 reply_message = TextMessage(text="沒有找到符合條件的營養成分或蔬菜。請檢查您的輸入。")
 
         if reply_message:
-            messaging_api.reply_message(
-                ReplyMessageRequest(reply_token=event.reply_token, messages=[reply_message])
-            )
-            print("Reply sent successfully.")
+            line_sender.reply(event, [reply_message])
+            app.logger.info("Reply queued.")
 
     except Exception as e:
-        print(f"Failed to reply: {e}")
+        app.logger.exception(f"Failed to reply: {e}")
+
+
+
+@app.route("/api/recipes/search", methods=["GET"])
+def search_recipes_by_keyword():
+    """關鍵字搜尋食譜標題與步驟，例如 /api/recipes/search?q=番茄炒蛋&page=1&per_page=10"""
+    query_text = request.args.get("q", "").strip()
+    if not query_text:
+        return jsonify({"error": "請提供關鍵字 q"}), 400
+    try:
+        page = int(request.args.get("page", 1))
+        per_page = int(request.args.get("per_page", 10))
+    except ValueError:
+        return jsonify({"error": "page 與 per_page 必須是整數"}), 400
+    # 回應帶實際使用的分頁值，客戶端才能用 total / per_page 算頁數
+    page, per_page = clamp_paging(page, per_page)
+
+    conn = get_db_connection()
+    if conn is None:
+        return jsonify({'error': '無法連接資料庫'}), 500
+    try:
+        cur = conn.cursor()
+        results, total = search_recipes(cur, query_text, page=page, per_page=per_page)
+        cur.close()
+        return jsonify({
+            "query": query_text,
+            "page": page,
+            "per_page": per_page,
+            "total": total,
+            "results": results,
+        })
+    except Exception as e:
+        app.logger.error(f"Error searching recipes for '{query_text}': {e}")
+        return jsonify({'error': '伺服器內部錯誤'}), 500
+    finally:
+        conn.close()
+
+
+@app.route("/api/recipes/match", methods=["GET"])
+def match_recipes_by_ingredients():
+    """依現有食材找食譜，例如 /api/recipes/match?ingredients=高麗菜,蒜頭"""
+    ingredients_text = request.args.get("ingredients", "").strip()
+    if not ingredients_text:
+        return jsonify({"error": "請提供食材 ingredients"}), 400
+    try:
+        limit = int(request.args.get("limit", 10))
+    except ValueError:
+        return jsonify({"error": "limit 必須是整數"}), 400
+    if limit < 1:
+        return jsonify({"error": "limit 必須大於 0"}), 400
+
+    recipe_index.ensure_fresh()
+    ingredients, unknown = recipe_index.resolve_ingredients(ingredients_text)
+    results = recipe_index.search(ingredients, limit=limit)
+    return jsonify({
+        "ingredients": ingredients,
+        "unknown": unknown,
+        "count": len(results),
+        "results": results,
+    })
+
+
+@app.route("/api/recipes/index/refresh", methods=["POST"])
+def refresh_recipe_index():
+    """
+    食譜異動後呼叫。body 帶 {"recipe_ids": [...]} 只重新索引這些食譜，
+    否則比對各食譜內容只更新有異動的部分。需要 X-Admin-Token。
+    只影響處理這個請求的 worker；其他 worker 在 RECIPE_INDEX_CHECK_SECONDS 內自行更新，
+    要立即套用到所有 worker 請以 kill -HUP 讓 gunicorn 重新載入。
+    """
+    _require_admin()
+    data = request.get_json(silent=True) or {}
+    recipe_ids = data.get("recipe_ids")
+    if recipe_ids:
+        try:
+            recipe_ids = [int(i) for i in recipe_ids]
+        except (TypeError, ValueError):
+            return jsonify({"error": "recipe_ids 必須是整數陣列"}), 400
+        ok = recipe_index.update_recipes(recipe_ids)
+    else:
+        ok = recipe_index.refresh()
+    if not ok:
+        return jsonify({"error": "無法連接資料庫"}), 500
+    return jsonify({"recipes": len(recipe_index.recipes), "ingredients": len(recipe_index.postings)})
+
+
+@app.route("/api/nutrients/query", methods=["GET"])
+def query_nutrients():
+    """多營養素條件查詢，例如 /api/nutrients/query?q=高蛋白 低鈉&limit=5"""
+    query_text = request.args.get("q", "").strip()
+    if not query_text:
+        return jsonify({"error": "請提供查詢條件 q"}), 400
+    try:
+        limit = int(request.args.get("limit", 10))
+    except ValueError:
+        return jsonify({"error": "limit 必須是整數"}), 400
+    if limit < 1:
+        return jsonify({"error": "limit 必須大於 0"}), 400
+
+    try:
+        results = query_vegetables_by_conditions(query_text, limit=limit)
+    except NutrientQueryError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # NaN 不是合法的 JSON，轉成 null
+    for veg in results:
+        veg["all_nutrients"] = {
+            k: (None if pd.isna(v) else v) for k, v in veg["all_nutrients"].items()
+        }
+    return jsonify({"query": query_text, "count": len(results), "results": results})
+
+
+@app.route("/api/webhook/stats", methods=["GET"])
+def webhook_dedup_stats():
+    """已處理、重複略過與 LINE 標記為重送的事件數"""
+    return jsonify(event_deduplicator.stats())
+
 
+@app.route("/api/users/stats", methods=["GET"])
+def user_state_stats():
+    """使用者狀態數量與圖片限流次數"""
+    return jsonify(user_states.stats())
+
+
+@app.route("/api/line/stats", methods=["GET"])
+def line_sender_stats():
+    """LINE 訊息發送佇列深度、成功/失敗次數與延遲分位數"""
+    return jsonify(line_sender.stats())
 
 
 @app.route("/api/image/<filename>")
@@ -790,10 +1173,14 @@ def get_image(filename):
     )
     bucket = os.getenv("MINIO_BUCKET_NAME", "veg-data-bucket")
     key = f"images/{filename}"
+    start = time.perf_counter()
     try:
         obj = s3.get_object(Bucket=bucket, Key=key)
-        return Response(obj["Body"].read(), mimetype="image/jpeg")
+        body = obj["Body"].read()
+        MINIO_FETCH_LATENCY.labels("image", "ok").observe(time.perf_counter() - start)
+        return Response(body, mimetype="image/jpeg")
     except Exception as e:
+        MINIO_FETCH_LATENCY.labels("image", "error").observe(time.perf_counter() - start)
         return "Not found", 404
 
 @app.route("/api/csv/<filename>")
@@ -808,22 +1195,141 @@ def get_csv(filename):
     )
     bucket = os.getenv("MINIO_BUCKET_NAME", "veg-data-bucket")
     key = filename
-    app.logger.info(f"嘗試從 MinIO 取得 bucket={bucket} key={key}")
+    app.logger.debug("嘗試從 MinIO 取得 bucket=%s key=%s", bucket, key)
+    start = time.perf_counter()
     try:
         obj = s3.get_object(Bucket=bucket, Key=key)
-        return Response(obj["Body"].read(), mimetype="text/csv")
+        body = obj["Body"].read()
+        MINIO_FETCH_LATENCY.labels("csv", "ok").observe(time.perf_counter() - start)
+        return Response(body, mimetype="text/csv")
     except Exception as e:
-        print(f"MinIO 取檔失敗: {e}")
+        MINIO_FETCH_LATENCY.labels("csv", "error").observe(time.perf_counter() - start)
         app.logger.error(f"MinIO 取檔失敗: {e}")
         return "Not found", 404
 
-try:
-    predictor = VegetablePredictor(
-        model_path="rec_veg/model_mnV2(best).keras", classes_path="rec_veg/classes.csv"
+DATASET_FORMATS = {
+    "arrow": ("to_ipc_stream", "application/vnd.apache.arrow.stream", "arrows"),
+    "parquet": ("to_parquet_bytes", "application/vnd.apache.parquet", "parquet"),
+    "csv": ("to_csv_bytes", "text/csv", "csv"),
+}
+DATASETS_UNAVAILABLE = {"error": "未安裝 pyarrow，欄式資料集無法使用"}
+
+
+@app.route("/api/datasets", methods=["GET"])
+def list_datasets():
+    """可查詢的欄式資料集與欄位型別"""
+    if dataset_registry is None:
+        return jsonify(DATASETS_UNAVAILABLE), 503
+    return jsonify(dataset_registry.describe())
+
+
+@app.route("/api/datasets/<name>", methods=["GET"])
+def get_dataset(name):
+    """
+    欄位投影與列篩選，例如：
+      /api/datasets/nutrition?columns=id,name_in_nutrition,iron_mg&where=iron_mg>2&where=calories_kcal<20
+      /api/datasets/season?where=vege_id=1,2,3&format=arrow
+    format：json（預設）、arrow（IPC stream）、parquet、csv
+    """
+    if dataset_registry is None:
+        return jsonify(DATASETS_UNAVAILABLE), 503
+    columns = [c.strip() for c in request.args.get("columns", "").split(",") if c.strip()]
+    output_format = request.args.get("format", "json")
+    if output_format != "json" and output_format not in DATASET_FORMATS:
+        return jsonify({"error": "format 只能是 json、arrow、parquet 或 csv"}), 400
+    try:
+        limit = int(request.args["limit"]) if "limit" in request.args else None
+        offset = int(request.args.get("offset", 0))
+    except ValueError:
+        return jsonify({"error": "limit 與 offset 必須是整數"}), 400
+    if (limit is not None and limit < 0) or offset < 0:
+        return jsonify({"error": "limit 與 offset 不可為負數"}), 400
+
+    try:
+        table = columnar.query_table(
+            dataset_registry.get(name),
+            columns=columns,
+            filters=request.args.getlist("where"),
+            limit=limit,
+            offset=offset,
+        )
+    except columnar.DatasetError as e:
+        status = 404 if name not in dataset_registry.tables else 400
+        return jsonify({"error": str(e)}), status
+
+    if output_format == "json":
+        return jsonify({"dataset": name, "count": table.num_rows, "rows": table.to_pylist()})
+    serializer, mimetype, extension = DATASET_FORMATS[output_format]
+    return Response(
+        getattr(columnar, serializer)(table),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"inline; filename={name}.{extension}"},
     )
-except Exception as e:
-    print(f"無法啟動應用程式: {e}")
-    predictor = None
+
+
+@app.route("/api/admin/datasets/reload", methods=["POST"])
+def reload_datasets():
+    """
+    以 columnar.py convert 更新資料集（例如從 MinIO 轉換 price）後重新 mmap。
+    只影響處理這個請求的 worker；多 worker 時請以 kill -HUP 讓 gunicorn 重新載入。
+    """
+    _require_admin()
+    if dataset_registry is None:
+        return jsonify(DATASETS_UNAVAILABLE), 503
+    try:
+        names = dataset_registry.reload()
+    except Exception as e:
+        app.logger.error(f"欄式資料集載入失敗: {e}")
+        return jsonify({"error": "資料集載入失敗"}), 500
+    return jsonify({"datasets": names})
+
+predictor = None
+dataset_registry = None
+
+
+def load_resources():
+    """
+    載入 Keras 模型、欄式資料集、營養成分表與食譜索引。
+    gunicorn preload 時在 master 執行一次，worker 以 copy-on-write 共用。
+    """
+    global predictor, dataset_registry
+    try:
+        predictor = VegetablePredictor(
+            model_path="rec_veg/model_mnV2(best).keras", classes_path="rec_veg/classes.csv"
+        )
+    except Exception as e:
+        app.logger.error(f"無法啟動應用程式: {e}")
+        predictor = None
+
+    # 附帶的 CSV 轉成 Arrow IPC 後以 mmap 載入；worker 共用 page cache
+    if columnar is None:
+        app.logger.warning("未安裝 pyarrow，停用欄式資料集；營養成分查詢改讀 CSV")
+    else:
+        dataset_registry = columnar.DatasetRegistry()
+        try:
+            converted = columnar.ensure_bundled_converted()
+            if converted:
+                app.logger.info(f"已轉換欄式資料集: {', '.join(converted)}")
+            app.logger.info(f"已載入欄式資料集: {', '.join(dataset_registry.reload())}")
+        except Exception as e:
+            app.logger.error(f"欄式資料集載入失敗: {e}")
+
+    # 營養成分表在啟動時就載入成 NumPy 陣列，避免第一個查詢才讀 CSV
+    try:
+        get_nutrient_table()
+    except Exception as e:
+        app.logger.error(f"營養成分表載入失敗: {e}")
+
+    try:
+        if recipe_index.rebuild():
+            app.logger.info(f"食譜索引建立完成，共 {len(recipe_index.recipes)} 筆食譜")
+    except Exception as e:
+        app.logger.error(f"食譜索引建立失敗: {e}")
+
+
+# 只需要取用本模組函式時（例如 benchmarks/micro.py）設 APP_PRELOAD=0，不連資料庫也不載入模型
+if os.getenv("APP_PRELOAD", "1") != "0":
+    load_resources()
 
 @app.route("/predict", methods=["POST"])
 def handle_prediction():
@@ -834,10 +1340,13 @@ def handle_prediction():
         if not data or "image" not in data:
             return jsonify({"error": "請求格式錯誤，未包含 'image' 欄位"}), 400
         base64_image = data["image"]
-        prediction_result = predictor.predict(base64_image)
+        with MODEL_INFERENCE_LATENCY.labels("api").time():
+            prediction_result = predictor.predict(base64_image)
+        MODEL_INFERENCES.labels("api", "ok").inc()
         return jsonify(prediction_result)
     except Exception as e:
-        print(f"API 處理時發生錯誤: {e}")
+        MODEL_INFERENCES.labels("api", "error").inc()
+        app.logger.exception(f"API 處理時發生錯誤: {e}")
         return jsonify({"error": "伺服器內部錯誤，無法辨識圖片"}), 500
 
 
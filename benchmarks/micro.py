@@ -0,0 +1,292 @@
+"""
+純 Python 熱點的微基準測試，可存成 baseline 並互相比較。
+
+量測項目：
+  flex_vegetable_*      _create_vegetable_flex_message（1 / 12 個 bubble，營養素查詢模式）
+  flex_recipe_carousel  create_recipe_flex_carousel（10 個食譜）
+  group_recipe_rows     /api/recipes 的食譜步驟分組（_group_recipe_rows）
+  parse_recognition     handle_image_message 的辨識字串解析（_parse_recognition_result）
+  preprocess_image      classify_utils.preprocess_image（224x224 縮放與正規化）
+  nutrient_top / alias  nutri_rec 的單一營養素推薦與名稱/別名查詢（讀實際 CSV）
+  nutrient_compound     nutri_query 多條件查詢
+  nutrient_parse        nutri_query 查詢字串解析
+  dataset_query         columnar.query_table 的欄位投影與列篩選（/api/datasets）
+
+app.py 相關項目需要完整的執行環境（linebot、tensorflow 等）；缺少套件的項目會標示 skipped。
+import app 時設定 APP_PRELOAD=0，不會連資料庫、載入模型或轉換欄式資料集。
+benchmarks/baselines/reference.json 是 README「微基準測試」一節記錄的環境所量測的結果。
+
+用法：
+    python benchmarks/micro.py run --save before          # 存到 benchmarks/baselines/before.json
+    python benchmarks/micro.py run --filter flex --save after
+    python benchmarks/micro.py compare before after       # 比較兩個 baseline
+    python benchmarks/micro.py compare before             # 與目前程式碼即時量測結果比較
+    python benchmarks/micro.py compare reference          # 與專案附帶的 baseline 比較
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_DIR = os.path.join(ROOT_DIR, "benchmarks", "baselines")
+sys.path.insert(0, ROOT_DIR)
+
+# import app.py 只為了取用其中的函式：跳過啟動時的資源載入，並給定假的 LINE 憑證、讓資料庫連線快速失敗
+os.environ.setdefault("APP_PRELOAD", "0")
+os.environ.setdefault("LINE_CHANNEL_ACCESS_TOKEN", "benchmark-token")
+os.environ.setdefault("LINE_CHANNEL_SECRET", "benchmark-secret")
+os.environ.setdefault("DATABASE_HOST", "127.0.0.1")
+os.environ.setdefault("DATABASE_PORT", "1")
+os.environ.setdefault("PGCONNECT_TIMEOUT", "1")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+_app_module = None
+
+
+def _app():
+    global _app_module
+    if _app_module is None:
+        import app as app_module
+        _app_module = app_module
+    return _app_module
+
+
+# ---------- 測試資料 ----------
+def _sample_vegetables(n):
+    from nutri_query import get_nutrient_table
+    return get_nutrient_table().query("高蛋白", limit=n)
+
+
+def _sample_recipes(n, steps=6):
+    return [
+        {
+            "id": i,
+            "name": f"蒜炒高麗菜 {i}",
+            "description": "將高麗菜洗淨切片備用",
+            "image_url": "https://i.imgur.com/your-default-image.png",
+            "steps": [f"第 {s} 步：熱鍋下油，放入蒜末爆香後加入高麗菜拌炒" for s in range(1, steps + 1)],
+        }
+        for i in range(1, n + 1)
+    ]
+
+
+def _sample_recipe_rows(n_recipes=50, steps=6):
+    return [
+        (recipe_id, f"食譜 {recipe_id}", step_no, f"步驟說明 {recipe_id}-{step_no}")
+        for recipe_id in range(1, n_recipes + 1)
+        for step_no in range(1, steps + 1)
+    ]
+
+
+# ---------- 量測項目 ----------
+# 每個項目回傳一個無參數的 callable；setup 在計時之外執行
+def case_flex_vegetable_1():
+    create = _app()._create_vegetable_flex_message
+    vegetables = _sample_vegetables(1)
+    return lambda: create(vegetables, "辨識結果：菠菜")
+
+
+def case_flex_vegetable_12():
+    create = _app()._create_vegetable_flex_message
+    vegetables = _sample_vegetables(12)
+    return lambda: create(vegetables, "為您推薦", is_nutrient_search=True)
+
+
+def case_flex_recipe_carousel():
+    create = _app().create_recipe_flex_carousel
+    recipes = _sample_recipes(10)
+    return lambda: create(recipes)
+
+
+def case_group_recipe_rows():
+    group = _app()._group_recipe_rows
+    rows = _sample_recipe_rows()
+    return lambda: group(rows)
+
+
+def case_parse_recognition():
+    parse = _app()._parse_recognition_result
+    text = "預測類別：高麗菜\n信心度：87.35%"
+    return lambda: parse(text)
+
+
+def case_preprocess_image():
+    from classify_utils import preprocess_image
+    image_path = os.path.join(ROOT_DIR, "richmenu_vege.jpg")
+    return lambda: preprocess_image(image_path)
+
+
+def case_nutrient_top():
+    from nutri_rec.nutri_rec import get_top_vegetables_by_nutrient
+    return lambda: get_top_vegetables_by_nutrient("蛋白質")
+
+
+def case_nutrient_alias():
+    from nutri_rec.nutri_rec import get_vegetables_by_name_or_alias
+    return lambda: get_vegetables_by_name_or_alias("高麗菜")
+
+
+def case_nutrient_compound():
+    from nutri_query import get_nutrient_table
+    table = get_nutrient_table()
+    return lambda: table.query("鐵質>2 且 熱量<20 高蛋白")
+
+
+def case_nutrient_parse():
+    from nutri_query import parse_query
+    # 運算子前後有空白的寫法也要能解析，否則暖機時就會失敗並標示 skipped
+    return lambda: parse_query("高蛋白 低鈉 鐵質 > 2 且 熱量 <20 鈣>= 50")
+
+
+def case_dataset_query():
+    from columnar import ensure_bundled_converted, load_table, query_table
+    ensure_bundled_converted()
+    table = load_table("nutrition")
+    return lambda: query_table(
+        table, columns=["id", "name_in_nutrition", "iron_mg"], filters=["iron_mg>1", "calories_kcal<30"]
+    )
+
+
+CASES = {
+    name[len("case_"):]: func
+    for name, func in sorted(globals().items())
+    if name.startswith("case_") and callable(func)
+}
+
+
+# ---------- 執行 ----------
+def measure(func, repeat=7, min_time=0.2):
+    """與 timeit 命令列相同：自動決定每輪次數，取多輪中每次呼叫的耗時"""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    number = max(1, int(number * min_time / 0.2))
+    per_call = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+    return {
+        "number": number,
+        "repeat": repeat,
+        "min_us": min(per_call) * 1e6,
+        "median_us": statistics.median(per_call) * 1e6,
+        "stdev_us": statistics.stdev(per_call) * 1e6 if len(per_call) > 1 else 0.0,
+    }
+
+
+def run_cases(name_filter=None, repeat=7):
+    results = {}
+    for name, setup in CASES.items():
+        if name_filter and name_filter not in name:
+            continue
+        try:
+            func = setup()
+            func()  # 暖機，同時確認可以執行
+        except Exception as e:
+            results[name] = {"skipped": f"{type(e).__name__}: {e}"}
+            print(f"{name:<24} skipped ({type(e).__name__}: {e})")
+            continue
+        result = measure(func, repeat=repeat)
+        results[name] = result
+        print(f"{name:<24} {result['median_us']:>12.2f} us  (min {result['min_us']:.2f}, ±{result['stdev_us']:.2f}, n={result['number']})")
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_baseline(name, results):
+    os.makedirs(BASELINE_DIR, exist_ok=True)
+    path = os.path.join(BASELINE_DIR, f"{name}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "name": name,
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "commit": _git_commit(),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "results": results,
+            },
+            f,
+            ensure_ascii=False,
+            indent=2,
+        )
+    print(f"已儲存 {path}")
+
+
+def load_baseline(name):
+    path = name if name.endswith(".json") else os.path.join(BASELINE_DIR, f"{name}.json")
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare(before, after, threshold):
+    """以 median 比較；變慢超過 threshold（例如 0.1 = 10%）列為 regression"""
+    print(f"{'case':<24}{'before(us)':>14}{'after(us)':>14}{'change':>10}")
+    regressions = []
+    for name in sorted(set(before) | set(after)):
+        b, a = before.get(name, {}), after.get(name, {})
+        if "median_us" not in b or "median_us" not in a:
+            print(f"{name:<24}{'-':>14}{'-':>14}{'n/a':>10}")
+            continue
+        change = a["median_us"] / b["median_us"] - 1
+        marker = ""
+        if change > threshold:
+            marker = "  slower"
+            regressions.append(name)
+        elif change < -threshold:
+            marker = "  faster"
+        print(f"{name:<24}{b['median_us']:>14.2f}{a['median_us']:>14.2f}{change:>+10.1%}{marker}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = sub.add_parser("run", help="執行微基準測試")
+    run_parser.add_argument("--filter", help="只執行名稱包含此字串的項目")
+    run_parser.add_argument("--repeat", type=int, default=7)
+    run_parser.add_argument("--save", metavar="NAME", help="存成 benchmarks/baselines/NAME.json")
+
+    compare_parser = sub.add_parser("compare", help="比較兩個 baseline，或 baseline 與目前程式碼")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after", nargs="?")
+    compare_parser.add_argument("--filter")
+    compare_parser.add_argument("--threshold", type=float, default=0.10, help="變慢多少視為 regression（預設 0.10）")
+
+    sub.add_parser("list", help="列出所有量測項目")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        print("\n".join(CASES))
+    elif args.command == "run":
+        results = run_cases(args.filter, args.repeat)
+        if args.save:
+            save_baseline(args.save, results)
+    else:
+        before = load_baseline(args.before)["results"]
+        if args.after:
+            after = load_baseline(args.after)["results"]
+        else:
+            after = run_cases(args.filter)
+            print()
+        if args.filter:
+            before = {k: v for k, v in before.items() if args.filter in k}
+            after = {k: v for k, v in after.items() if args.filter in k}
+        regressions = compare(before, after, args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
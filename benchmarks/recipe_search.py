@@ -0,0 +1,149 @@
+"""
+食譜搜尋效能比較：pg_trgm / bigram GIN 索引 vs. 無索引 ILIKE。
+
+在獨立的 schema（預設 bench_recipe_search）產生假食譜資料，
+先量測沒有索引的 ILIKE，再套用 init/90_recipe_search.sql 的索引量測 recipe_search.search_recipes。
+結果依查詢長度分開列出：1～2 字的查詢取不出 trigram，ILIKE 即使有 trigram 索引也接近全表掃描，
+search_recipes 對這類查詢改走 bigram 索引。
+不會動到正式的 main_recipe / recipe_steps。
+
+用法：
+    python benchmarks/recipe_search.py --recipes 20000 --repeat 20
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+import psycopg2
+from psycopg2.extras import execute_values
+from dotenv import load_dotenv
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+from recipe_search import NAIVE_SEARCH_SQL, escape_like, search_recipes  # noqa: E402
+
+VEGETABLES = ["高麗菜", "菠菜", "空心菜", "番茄", "茄子", "苦瓜", "絲瓜", "青花菜", "紅蘿蔔", "洋蔥",
+              "蒜頭", "九層塔", "芹菜", "山藥", "蓮藕", "地瓜葉", "小白菜", "大白菜", "玉米", "南瓜"]
+METHODS = ["清炒", "涼拌", "燉", "蒸", "烤", "煎", "滷", "煮湯", "熱炒", "焗"]
+EXTRAS = ["雞蛋", "豬肉", "牛肉", "豆腐", "蝦仁", "香菇", "蛤蜊", "雞肉", "培根", "魚片"]
+STEP_TEMPLATES = [
+    "將{veg}洗淨切段備用",
+    "熱鍋下油，放入{extra}炒至半熟",
+    "加入{veg}大火{method}約三分鐘",
+    "以鹽、醬油調味後盛盤",
+    "{extra}先用米酒醃十分鐘",
+    "最後撒上蔥花與{veg}即可",
+]
+
+QUERY_GROUPS = {
+    "1～2 字": ["蒜頭", "豆腐", "南瓜", "菠菜", "蛋"],
+    "3 字以上": ["高麗菜", "番茄炒蛋", "涼拌苦瓜", "地瓜葉"],
+}
+
+
+def generate_corpus(n_recipes, steps_per_recipe=5, seed=42):
+    rng = random.Random(seed)
+    recipes, steps = [], []
+    for recipe_id in range(1, n_recipes + 1):
+        veg = rng.choice(VEGETABLES)
+        extra = rng.choice(EXTRAS)
+        method = rng.choice(METHODS)
+        recipes.append((recipe_id, f"{method}{veg}{extra}", rng.randint(1, 60)))
+        for step_no in range(1, steps_per_recipe + 1):
+            template = rng.choice(STEP_TEMPLATES)
+            steps.append((recipe_id, step_no, template.format(veg=veg, extra=extra, method=method)))
+    return recipes, steps
+
+
+def setup_schema(cur, schema, recipes, steps):
+    cur.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE;")
+    cur.execute(f"CREATE SCHEMA {schema};")
+    cur.execute(f"SET search_path TO {schema}, public;")
+    cur.execute("CREATE TABLE main_recipe (id integer PRIMARY KEY, recipe text, vege_id integer);")
+    cur.execute("CREATE TABLE recipe_steps (recipe_id integer, step_no integer, description text);")
+    execute_values(cur, "INSERT INTO main_recipe VALUES %s", recipes, page_size=5000)
+    execute_values(cur, "INSERT INTO recipe_steps VALUES %s", steps, page_size=5000)
+    cur.execute("CREATE INDEX ON recipe_steps (recipe_id);")
+    cur.execute("ANALYZE main_recipe; ANALYZE recipe_steps;")
+
+
+def create_search_indexes(cur):
+    """套用正式的索引腳本；search_path 指向測試 schema，索引與 recipe_bigrams() 都建在測試 schema 內"""
+    # extension 先明確建在 public，避免 DROP SCHEMA CASCADE 時一起被刪掉
+    cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm SCHEMA public;")
+    with open(os.path.join(ROOT_DIR, "init", "90_recipe_search.sql"), encoding="utf-8") as f:
+        cur.execute(f.read())
+
+
+def time_queries(fn, queries, repeat):
+    timings = []
+    for _ in range(repeat):
+        for query in queries:
+            start = time.perf_counter()
+            fn(query)
+            timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        "mean": statistics.mean(timings),
+        "p50": timings[len(timings) // 2],
+        "p95": timings[int(len(timings) * 0.95) - 1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--recipes", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--schema", default="bench_recipe_search")
+    parser.add_argument("--keep", action="store_true", help="結束後保留測試 schema")
+    args = parser.parse_args()
+
+    load_dotenv()
+    conn = psycopg2.connect(
+        host=os.getenv("DATABASE_HOST"),
+        database=os.getenv("DATABASE_NAME"),
+        user=os.getenv("DATABASE_USER"),
+        password=os.getenv("DATABASE_PASSWORD"),
+        port=os.getenv("DATABASE_PORT"),
+    )
+    conn.autocommit = True
+    cur = conn.cursor()
+
+    try:
+        recipes, steps = generate_corpus(args.recipes)
+        print(f"產生 {len(recipes)} 筆食譜、{len(steps)} 個步驟")
+        setup_schema(cur, args.schema, recipes, steps)
+
+        def naive(query):
+            cur.execute(NAIVE_SEARCH_SQL, {"pattern": f"%{escape_like(query)}%", "limit": 10, "offset": 0})
+            cur.fetchall()
+
+        naive_stats = {name: time_queries(naive, queries, args.repeat) for name, queries in QUERY_GROUPS.items()}
+        create_search_indexes(cur)
+        naive_indexed_stats = {name: time_queries(naive, queries, args.repeat) for name, queries in QUERY_GROUPS.items()}
+        ranked_stats = {
+            name: time_queries(lambda q: search_recipes(cur, q), queries, args.repeat)
+            for name, queries in QUERY_GROUPS.items()
+        }
+
+        for name, queries in QUERY_GROUPS.items():
+            print(f"\n查詢 {name}：{'、'.join(queries)}")
+            print(f"{'方法':<24}{'mean(ms)':>10}{'p50(ms)':>10}{'p95(ms)':>10}")
+            for label, stats in [
+                ("ILIKE 無索引", naive_stats[name]),
+                ("ILIKE + trigram 索引", naive_indexed_stats[name]),
+                ("search_recipes", ranked_stats[name]),
+            ]:
+                print(f"{label:<24}{stats['mean']:>10.2f}{stats['p50']:>10.2f}{stats['p95']:>10.2f}")
+    finally:
+        if not args.keep:
+            cur.execute(f"DROP SCHEMA IF EXISTS {args.schema} CASCADE;")
+        cur.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+比較 gunicorn 1/2/4/8 個 worker 時 /predict 的吞吐量與記憶體用量。
+
+每一輪以 gunicorn.conf.py 啟動 app（WEB_CONCURRENCY=N），
+用 2N 個並行連線送出同一張圖片，統計 req/s、延遲分位數，
+並從 /proc/<pid>/smaps_rollup 讀取各 process 的 PSS（共用分頁平分後的實際占用）。
+需要 .env 中的 LINE 與資料庫設定（app.py import 時會讀取）。
+
+用法：
+    python benchmarks/worker_scaling.py --workers 1 2 4 8 --requests 200
+"""
+import argparse
+import base64
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def wait_until_ready(base_url, timeout=180):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"{base_url}/api/line/stats", timeout=2)
+            return True
+        except requests.RequestException:
+            time.sleep(1)
+    return False
+
+
+def process_tree_pss_kb(root_pid):
+    """master 與所有子 process 的 PSS 總和（KB），只在 Linux 上有值"""
+    pids = [root_pid]
+    children_path = f"/proc/{root_pid}/task/{root_pid}/children"
+    if os.path.exists(children_path):
+        with open(children_path) as f:
+            pids += [int(p) for p in f.read().split()]
+    total = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/smaps_rollup") as f:
+                for line in f:
+                    if line.startswith("Pss:"):
+                        total += int(line.split()[1])
+        except OSError:
+            return None
+    return total
+
+
+def run_round(n_workers, port, payload, n_requests):
+    env = dict(os.environ, WEB_CONCURRENCY=str(n_workers), PORT=str(port))
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"],
+        cwd=ROOT_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        if not wait_until_ready(base_url):
+            raise RuntimeError(f"{n_workers} workers 啟動逾時")
+
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=n_workers * 2)
+        session.mount("http://", adapter)
+
+        def one_request(_):
+            start = time.perf_counter()
+            response = session.post(f"{base_url}/predict", json=payload, timeout=120)
+            return time.perf_counter() - start, response.status_code
+
+        # 暖機：每個 worker 第一次推論會比較慢
+        with ThreadPoolExecutor(max_workers=n_workers * 2) as pool:
+            list(pool.map(one_request, range(n_workers * 2)))
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=n_workers * 2) as pool:
+            results = list(pool.map(one_request, range(n_requests)))
+        elapsed = time.perf_counter() - start
+
+        latencies = sorted(r[0] * 1000 for r in results)
+        errors = sum(1 for r in results if r[1] != 200)
+        return {
+            "workers": n_workers,
+            "rps": n_requests / elapsed,
+            "p50": statistics.median(latencies),
+            "p95": latencies[int(len(latencies) * 0.95) - 1],
+            "errors": errors,
+            "pss_mb": (process_tree_pss_kb(server.pid) or 0) / 1024,
+        }
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--image", default=os.path.join(ROOT_DIR, "richmenu_vege.jpg"))
+    args = parser.parse_args()
+
+    with open(args.image, "rb") as f:
+        payload = {"image": base64.b64encode(f.read()).decode("utf-8")}
+
+    print(f"{'workers':>8}{'req/s':>10}{'p50(ms)':>10}{'p95(ms)':>10}{'errors':>8}{'PSS(MB)':>10}")
+    for n_workers in args.workers:
+        r = run_round(n_workers, args.port, payload, args.requests)
+        print(
+            f"{r['workers']:>8}{r['rps']:>10.1f}{r['p50']:>10.1f}{r['p95']:>10.1f}"
+            f"{r['errors']:>8}{r['pss_mb']:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+批次匯入蔬菜、營養成分、產季與食譜資料。
+
+每個資料集都走同樣的流程（全部在同一個 transaction 內）：
+  1. 建立與目標資料表同結構的暫存表（TEMP TABLE ... LIKE）
+  2. 以 COPY FROM STDIN 將 CSV 一次灌入暫存表
+  3. 暫存表內依主鍵去重
+  4. UPDATE 既有資料（只更新有變動的列）、INSERT 新資料
+重複執行結果相同（idempotent），不需要目標表上有 UNIQUE 約束。
+
+用法：
+    python bulk_load.py                                   # 匯入專案附帶的 CSV
+    python bulk_load.py --recipes recipes.csv --recipe-steps steps.csv
+    python bulk_load.py --only nutrition season --dry-run
+"""
+import argparse
+import csv
+import io
+import os
+import time
+
+import psycopg2
+from psycopg2 import sql
+from dotenv import load_dotenv
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+# 每個資料集：目標表、CSV 欄位、主鍵欄位
+DATASETS = {
+    "vegetables": {
+        "table": "basic_vege",
+        "columns": ["id", "vege_name"],
+        "keys": ["id"],
+    },
+    "nutrition": {
+        "table": "vege_nutrition",
+        "columns": [
+            "id", "name_in_nutrition", "calories_kcal", "water_g", "protein_g", "fat_g",
+            "carb_g", "fiber_g", "sugar_g", "sodium_mg", "potassium_mg", "calcium_mg",
+            "magnesium_mg", "iron_mg", "zinc_mg", "phosphorus_mg", "vitamin_a_iu",
+            "vitamin_c_mg", "vitamin_e_mg", "vitamin_b1_mg", "folic_acid_ug", "vege_id",
+        ],
+        "keys": ["id"],
+    },
+    "season": {
+        "table": "fresh_month",
+        "columns": ["vege_id", "vege_name", "fresh_month"],
+        "keys": ["vege_id", "fresh_month"],
+    },
+    "recipes": {
+        "table": "main_recipe",
+        "columns": ["id", "recipe", "vege_id"],
+        "keys": ["id"],
+    },
+    "recipe_steps": {
+        "table": "recipe_steps",
+        "columns": ["recipe_id", "step_no", "description"],
+        "keys": ["recipe_id", "step_no"],
+    },
+}
+# 依外鍵相依順序匯入
+LOAD_ORDER = ["vegetables", "nutrition", "season", "recipes", "recipe_steps"]
+
+
+def vegetables_from_fresh_month(path):
+    """basic_vege 沒有獨立的 CSV，從 fresh_month.csv 取出不重複的 (vege_id, vege_name)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["id", "vege_name"])
+    seen = set()
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            if row["vege_id"] in seen:
+                continue
+            seen.add(row["vege_id"])
+            writer.writerow([row["vege_id"], row["vege_name"]])
+    buffer.seek(0)
+    return buffer
+
+
+def _csv_columns(source):
+    header = next(csv.reader([source.readline()]))
+    source.seek(0)
+    return header
+
+
+def load_dataset(cur, name, source):
+    """將單一 CSV 匯入對應資料表，回傳 (複製列數, 新增列數, 更新列數)"""
+    spec = DATASETS[name]
+    table = sql.Identifier(spec["table"])
+    staging = sql.Identifier(f"stg_{spec['table']}")
+
+    columns = _csv_columns(source)
+    unknown = [c for c in columns if c not in spec["columns"]]
+    if unknown:
+        raise ValueError(f"{name} 的 CSV 有無法對應的欄位：{', '.join(unknown)}")
+    missing_keys = set(spec["keys"]) - set(columns)
+    if missing_keys:
+        raise ValueError(f"{name} 的 CSV 缺少主鍵欄位：{', '.join(sorted(missing_keys))}")
+    values = [c for c in columns if c not in spec["keys"]]
+
+    col_list = sql.SQL(", ").join(map(sql.Identifier, columns))
+    key_match = sql.SQL(" AND ").join(
+        sql.SQL("t.{0} = s.{0}").format(sql.Identifier(k)) for k in spec["keys"]
+    )
+
+    cur.execute(sql.SQL(
+        "CREATE TEMP TABLE {} (LIKE {} INCLUDING DEFAULTS) ON COMMIT DROP;"
+    ).format(staging, table))
+
+    copy_stmt = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv, HEADER true)").format(
+        staging, col_list
+    )
+    cur.copy_expert(copy_stmt.as_string(cur), source)
+    copied = cur.rowcount
+
+    # 同一批資料裡主鍵重複時保留最後一筆
+    cur.execute(sql.SQL(
+        "DELETE FROM {0} a USING {0} b WHERE {1} AND a.ctid < b.ctid;"
+    ).format(staging, sql.SQL(" AND ").join(
+        sql.SQL("a.{0} = b.{0}").format(sql.Identifier(k)) for k in spec["keys"]
+    )))
+
+    updated = 0
+    if values:
+        cur.execute(sql.SQL(
+            "UPDATE {table} AS t SET {assignments} FROM {staging} AS s "
+            "WHERE {key_match} AND ({changed});"
+        ).format(
+            table=table,
+            staging=staging,
+            assignments=sql.SQL(", ").join(
+                sql.SQL("{0} = s.{0}").format(sql.Identifier(c)) for c in values
+            ),
+            key_match=key_match,
+            changed=sql.SQL(" OR ").join(
+                sql.SQL("t.{0} IS DISTINCT FROM s.{0}").format(sql.Identifier(c)) for c in values
+            ),
+        ))
+        updated = cur.rowcount
+
+    cur.execute(sql.SQL(
+        "INSERT INTO {table} ({cols}) SELECT {s_cols} FROM {staging} AS s "
+        "WHERE NOT EXISTS (SELECT 1 FROM {table} AS t WHERE {key_match});"
+    ).format(
+        table=table,
+        cols=col_list,
+        s_cols=sql.SQL(", ").join(sql.SQL("s.{}").format(sql.Identifier(c)) for c in columns),
+        staging=staging,
+        key_match=key_match,
+    ))
+    inserted = cur.rowcount
+
+    # 手動指定 id 後要把 serial 序列推到最大值，之後 app 新增資料才不會撞號
+    if "id" in spec["keys"]:
+        cur.execute(
+            sql.SQL(
+                "SELECT setval(seq, GREATEST((SELECT COALESCE(MAX(id), 0) FROM {}), 1)) "
+                "FROM pg_get_serial_sequence(%s, 'id') AS seq WHERE seq IS NOT NULL;"
+            ).format(table),
+            (spec["table"],),
+        )
+
+    cur.execute(sql.SQL("DROP TABLE {};").format(staging))
+    return copied, inserted, updated
+
+
+def open_sources(args):
+    sources = {
+        "vegetables": lambda: vegetables_from_fresh_month(args.fresh_month),
+        "nutrition": lambda: open(args.nutrition, newline="", encoding="utf-8"),
+        "season": lambda: open(args.fresh_month, newline="", encoding="utf-8"),
+    }
+    if args.recipes:
+        sources["recipes"] = lambda: open(args.recipes, newline="", encoding="utf-8")
+    if args.recipe_steps:
+        sources["recipe_steps"] = lambda: open(args.recipe_steps, newline="", encoding="utf-8")
+    return sources
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nutrition", default=os.path.join(BASE_DIR, "vege_nutrition_new.csv"))
+    parser.add_argument("--fresh-month", default=os.path.join(BASE_DIR, "fresh_month.csv"))
+    parser.add_argument("--recipes", help="main_recipe CSV（欄位：id,recipe,vege_id）")
+    parser.add_argument("--recipe-steps", help="recipe_steps CSV（欄位：recipe_id,step_no,description）")
+    parser.add_argument("--only", nargs="+", choices=LOAD_ORDER, help="只匯入指定的資料集")
+    parser.add_argument("--nutrition-table", default=DATASETS["nutrition"]["table"])
+    parser.add_argument("--season-table", default=DATASETS["season"]["table"])
+    parser.add_argument("--dry-run", action="store_true", help="執行完畢後 rollback，不寫入")
+    args = parser.parse_args()
+
+    DATASETS["nutrition"]["table"] = args.nutrition_table
+    DATASETS["season"]["table"] = args.season_table
+
+    load_dotenv()
+    conn = psycopg2.connect(
+        host=os.getenv("DATABASE_HOST"),
+        database=os.getenv("DATABASE_NAME"),
+        user=os.getenv("DATABASE_USER"),
+        password=os.getenv("DATABASE_PASSWORD"),
+        port=os.getenv("DATABASE_PORT"),
+    )
+
+    sources = open_sources(args)
+    names = [n for n in LOAD_ORDER if n in sources and (not args.only or n in args.only)]
+
+    total_start = time.perf_counter()
+    total_rows = 0
+    try:
+        with conn:
+            cur = conn.cursor()
+            for name in names:
+                start = time.perf_counter()
+                with sources[name]() as source:
+                    copied, inserted, updated = load_dataset(cur, name, source)
+                elapsed = time.perf_counter() - start
+                total_rows += copied
+                print(
+                    f"{name:<13} {DATASETS[name]['table']:<16} "
+                    f"複製 {copied:>7} 列  新增 {inserted:>7}  更新 {updated:>7}  "
+                    f"{elapsed:6.2f}s  {copied / elapsed if elapsed else 0:>10.0f} rows/s"
+                )
+            cur.close()
+            if args.dry_run:
+                conn.rollback()
+                print("dry-run：已 rollback")
+    finally:
+        conn.close()
+
+    elapsed = time.perf_counter() - total_start
+    print(f"合計 {total_rows} 列，{elapsed:.2f}s，{total_rows / elapsed if elapsed else 0:.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main()
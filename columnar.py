@@ -0,0 +1,289 @@
+"""
+欄式資料集：把營養成分、產季、價格等 CSV 轉成 Arrow IPC 與 Parquet。
+
+- Arrow IPC（.arrow）：app 啟動時以 mmap 開啟，不需要解析文字，多個 worker 共用同一份 page cache
+- Parquet（.parquet）：壓縮後較小，適合下載或放回 MinIO
+- /api/datasets/<name> 以欄位投影與列篩選回傳部分資料，不必整份 CSV 傳給前端
+
+用法：
+    python columnar.py convert                              # 轉換專案附帶的 CSV
+    python columnar.py convert --minio-key price.csv --name price   # 從 MinIO 取 CSV 轉換
+    python columnar.py compare                              # 比較檔案大小與載入時間
+"""
+import argparse
+import io
+import os
+import re
+import time
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+COLUMNAR_DIR = os.getenv("COLUMNAR_DIR", os.path.join(BASE_DIR, "data", "columnar"))
+
+# 專案附帶的資料集：名稱 -> CSV 路徑；其餘資料集（如從 MinIO 轉換的 price）以 COLUMNAR_DIR 內的檔案為準
+BUNDLED_DATASETS = {
+    "nutrition": os.path.join(BASE_DIR, "vege_nutrition_new.csv"),
+    "season": os.path.join(BASE_DIR, "fresh_month.csv"),
+}
+
+DATASET_NAME_RE = re.compile(r"^[A-Za-z0-9_-]+$")
+FILTER_RE = re.compile(r"^(?P<column>[A-Za-z0-9_]+)\s*(?P<op>>=|<=|!=|>|<|=|~)\s*(?P<value>.+)$")
+
+FILTER_OPERATORS = {
+    "=": pc.equal,
+    "!=": pc.not_equal,
+    ">": pc.greater,
+    ">=": pc.greater_equal,
+    "<": pc.less,
+    "<=": pc.less_equal,
+}
+
+
+class DatasetError(ValueError):
+    """資料集名稱、欄位或篩選條件不正確"""
+
+
+def arrow_path(name):
+    return os.path.join(COLUMNAR_DIR, f"{name}.arrow")
+
+
+def parquet_path(name):
+    return os.path.join(COLUMNAR_DIR, f"{name}.parquet")
+
+
+# ---------- 轉換 ----------
+def convert_csv(name, source, compression="zstd"):
+    """
+    將 CSV（路徑或 bytes）轉成 <name>.arrow 與 <name>.parquet。
+    先寫暫存檔再 rename，正在 mmap 舊檔的 process 不受影響。
+    """
+    if not DATASET_NAME_RE.match(name):
+        raise DatasetError(f"不合法的資料集名稱：{name}")
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    table = pa_csv.read_csv(source)
+
+    os.makedirs(COLUMNAR_DIR, exist_ok=True)
+    tmp_arrow = arrow_path(name) + ".tmp"
+    with pa.OSFile(tmp_arrow, "wb") as sink:
+        # IPC 檔案格式不壓縮，才能 mmap 後直接零拷貝讀取
+        with ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_arrow, arrow_path(name))
+
+    tmp_parquet = parquet_path(name) + ".tmp"
+    pq.write_table(table, tmp_parquet, compression=compression)
+    os.replace(tmp_parquet, parquet_path(name))
+    return table.num_rows
+
+
+def ensure_bundled_converted():
+    """專案附帶的 CSV 若比欄式檔案新（或尚未轉換）就重新轉換，回傳有轉換的資料集名稱"""
+    converted = []
+    for name, csv_path in BUNDLED_DATASETS.items():
+        if not os.path.exists(csv_path):
+            continue
+        target = arrow_path(name)
+        if not os.path.exists(target) or os.path.getmtime(target) < os.path.getmtime(csv_path):
+            convert_csv(name, csv_path)
+            converted.append(name)
+    return converted
+
+
+# ---------- 載入 ----------
+def load_table(name):
+    """以 mmap 開啟 Arrow IPC 檔；資料留在 page cache，不會複製到 Python heap"""
+    source = pa.memory_map(arrow_path(name), "r")
+    return ipc.open_file(source).read_all()
+
+
+class DatasetRegistry:
+    """啟動時載入 COLUMNAR_DIR 內所有 .arrow 檔；檔案更新後可呼叫 reload()"""
+
+    def __init__(self):
+        self.tables = {}
+
+    def reload(self):
+        tables = {}
+        if os.path.isdir(COLUMNAR_DIR):
+            for filename in sorted(os.listdir(COLUMNAR_DIR)):
+                if filename.endswith(".arrow"):
+                    name = filename[: -len(".arrow")]
+                    tables[name] = load_table(name)
+        self.tables = tables
+        return list(tables)
+
+    def get(self, name):
+        table = self.tables.get(name)
+        if table is None:
+            raise DatasetError(f"找不到資料集：{name}")
+        return table
+
+    def describe(self):
+        return {
+            name: {
+                "rows": table.num_rows,
+                "columns": [{"name": f.name, "type": str(f.type)} for f in table.schema],
+            }
+            for name, table in self.tables.items()
+        }
+
+
+# ---------- 查詢 ----------
+def _parse_value(raw, arrow_type):
+    if pa.types.is_integer(arrow_type):
+        return int(raw)
+    if pa.types.is_floating(arrow_type):
+        return float(raw)
+    return raw
+
+
+def query_table(table, columns=None, filters=(), limit=None, offset=0):
+    """
+    欄位投影與列篩選：
+      columns：要回傳的欄位清單
+      filters：["calories_kcal<20", "vege_id=3", "vege_name~菜"]，多個條件以 AND 結合；
+               ~ 表示字串包含，數值欄位的 = 可用逗號列出多個值（vege_id=1,2,3）
+    """
+    mask = None
+    for expression in filters:
+        match = FILTER_RE.match(expression.strip())
+        if not match:
+            raise DatasetError(f"無法解析的篩選條件：{expression}")
+        column, op, raw_value = match.group("column"), match.group("op"), match.group("value").strip()
+        if column not in table.column_names:
+            raise DatasetError(f"沒有這個欄位：{column}")
+        array = table.column(column)
+        try:
+            if op == "~":
+                condition = pc.match_substring(array, raw_value)
+            elif op == "=" and "," in raw_value:
+                values = pa.array([_parse_value(v.strip(), array.type) for v in raw_value.split(",")], type=array.type)
+                condition = pc.is_in(array, value_set=values)
+            else:
+                condition = FILTER_OPERATORS[op](array, pa.scalar(_parse_value(raw_value, array.type), type=array.type))
+        except (ValueError, pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError) as e:
+            raise DatasetError(f"篩選條件 {expression} 不適用於欄位型別 {array.type}：{e}")
+        # null 比較結果視為不符合
+        condition = pc.fill_null(condition, False)
+        mask = condition if mask is None else pc.and_(mask, condition)
+
+    if mask is not None:
+        table = table.filter(mask)
+    if columns:
+        missing = [c for c in columns if c not in table.column_names]
+        if missing:
+            raise DatasetError(f"沒有這些欄位：{', '.join(missing)}")
+        table = table.select(columns)
+    if offset or limit is not None:
+        table = table.slice(offset, limit)
+    return table
+
+
+def to_ipc_stream(table):
+    sink = pa.BufferOutputStream()
+    with ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def to_parquet_bytes(table):
+    sink = pa.BufferOutputStream()
+    pq.write_table(table, sink, compression="zstd")
+    return sink.getvalue().to_pybytes()
+
+
+def to_csv_bytes(table):
+    sink = pa.BufferOutputStream()
+    pa_csv.write_csv(table, sink)
+    return sink.getvalue().to_pybytes()
+
+
+# ---------- CLI ----------
+def _fetch_from_minio(key):
+    import boto3
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    s3 = boto3.client(
+        "s3",
+        endpoint_url=os.getenv("MINIO_ENDPOINT"),
+        aws_access_key_id=os.getenv("MINIO_ACCESS_KEY"),
+        aws_secret_access_key=os.getenv("MINIO_SECRET_KEY"),
+        config=boto3.session.Config(signature_version="s3v4"),
+    )
+    bucket = os.getenv("MINIO_BUCKET_NAME", "veg-data-bucket")
+    return s3.get_object(Bucket=bucket, Key=key)["Body"].read()
+
+
+def _time(fn, repeat=20):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+def compare_formats(name, csv_path):
+    import pandas as pd
+
+    sizes = {
+        "csv": os.path.getsize(csv_path),
+        "arrow": os.path.getsize(arrow_path(name)),
+        "parquet": os.path.getsize(parquet_path(name)),
+    }
+    loads = {
+        "csv": _time(lambda: pd.read_csv(csv_path)),
+        "arrow": _time(lambda: load_table(name)),
+        "parquet": _time(lambda: pq.read_table(parquet_path(name))),
+    }
+    # 實際使用時常只讀少數欄位
+    first_column = load_table(name).column_names[0]
+    projected = {
+        "csv": _time(lambda: pd.read_csv(csv_path, usecols=[first_column])),
+        "arrow": _time(lambda: load_table(name).select([first_column])),
+        "parquet": _time(lambda: pq.read_table(parquet_path(name), columns=[first_column])),
+    }
+    print(f"\n[{name}] rows={load_table(name).num_rows}")
+    print(f"{'format':<10}{'size(KB)':>12}{'load(ms)':>12}{'1 column(ms)':>15}")
+    for fmt in ("csv", "arrow", "parquet"):
+        print(f"{fmt:<10}{sizes[fmt] / 1024:>12.1f}{loads[fmt]:>12.3f}{projected[fmt]:>15.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    convert_parser = sub.add_parser("convert", help="CSV 轉 Arrow IPC 與 Parquet")
+    convert_parser.add_argument("--name", help="資料集名稱（搭配 --csv 或 --minio-key）")
+    convert_parser.add_argument("--csv", help="本機 CSV 路徑")
+    convert_parser.add_argument("--minio-key", help="MinIO 上的 CSV key，例如 price.csv")
+
+    sub.add_parser("compare", help="比較專案附帶資料集的 CSV / Arrow / Parquet 大小與載入時間")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        if args.csv or args.minio_key:
+            if not args.name:
+                parser.error("--csv / --minio-key 需要搭配 --name")
+            source = args.csv if args.csv else _fetch_from_minio(args.minio_key)
+            rows = convert_csv(args.name, source)
+            print(f"{args.name}: {rows} 列 -> {arrow_path(args.name)}, {parquet_path(args.name)}")
+        else:
+            for name, csv_path in BUNDLED_DATASETS.items():
+                rows = convert_csv(name, csv_path)
+                print(f"{name}: {rows} 列 -> {arrow_path(name)}, {parquet_path(name)}")
+    else:
+        ensure_bundled_converted()
+        for name, csv_path in BUNDLED_DATASETS.items():
+            compare_formats(name, csv_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+# ============= Webhook 事件去重 ===============
+# LINE 在 webhook 逾時時會重送同一個事件（deliveryContext.isRedelivery = true），
+# 若每次都重新下載圖片、推論、回覆，只會讓已經過載的服務更慢。
+# 以 webhookEventId（沒有時退回 message id）為 key 記錄處理過的事件：
+# - MemoryEventStore：單一 process 內有上限、有 TTL 的 LRU
+# - PostgresEventStore：多個 gunicorn worker 共用，表結構見 init/91_webhook_events.sql
+# handler 拋出例外時釋放紀錄，LINE 因 500 或逾時重送時才會重新處理。
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 600        # LINE 重送在數分鐘內，保留 10 分鐘足夠
+DEFAULT_MAX_ENTRIES = 50000
+
+
+class MemoryEventStore:
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._seen = OrderedDict()  # event_key -> 首次收到的時間
+        self._lock = threading.Lock()
+
+    def claim(self, key):
+        """第一次看到這個 key 回傳 True；TTL 內重複出現回傳 False"""
+        now = time.monotonic()
+        with self._lock:
+            # 依插入順序淘汰過期項目
+            while self._seen:
+                _, seen_at = next(iter(self._seen.items()))
+                if now - seen_at < self.ttl and len(self._seen) < self.max_entries:
+                    break
+                self._seen.popitem(last=False)
+
+            if key in self._seen:
+                return False
+            self._seen[key] = now
+            return True
+
+    def release(self, key):
+        """處理失敗時移除紀錄，讓重送的事件可以再處理一次"""
+        with self._lock:
+            self._seen.pop(key, None)
+
+    def __len__(self):
+        return len(self._seen)
+
+
+class PostgresEventStore:
+    CLEANUP_EVERY = 500
+
+    def __init__(self, connection_factory, ttl=DEFAULT_TTL, fallback=None, max_idle=4):
+        self.ttl = ttl
+        self._connection_factory = connection_factory
+        # 資料庫連不上時退回記憶體版，寧可少擋重送也不要擋掉新事件
+        self._fallback = fallback or MemoryEventStore(ttl=ttl)
+        self._claims = 0
+        # 每個事件都要查一次，閒置連線留著重用；fork 後重新建立，不沿用 master 的連線
+        self.max_idle = max_idle
+        self._idle = queue.LifoQueue(maxsize=max_idle)
+        self._pid = os.getpid()
+
+    def _acquire(self):
+        if self._pid != os.getpid():
+            self._idle = queue.LifoQueue(maxsize=self.max_idle)
+            self._pid = os.getpid()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connection_factory()
+
+    def _put_back(self, conn, healthy):
+        if healthy and not conn.closed:
+            try:
+                self._idle.put_nowait(conn)
+                return
+            except queue.Full:
+                pass
+        conn.close()
+
+    def claim(self, key):
+        conn = self._acquire()
+        if conn is None:
+            return self._fallback.claim(key)
+        healthy = False
+        try:
+            with conn:
+                cur = conn.cursor()
+                # 新事件或已過期的舊紀錄才會回傳一列
+                cur.execute(
+                    """
+                    INSERT INTO webhook_events (event_key, received_at)
+                    VALUES (%s, now())
+                    ON CONFLICT (event_key) DO UPDATE
+                        SET received_at = EXCLUDED.received_at
+                        WHERE webhook_events.received_at < now() - make_interval(secs => %s)
+                    RETURNING event_key;
+                    """,
+                    (key, self.ttl),
+                )
+                claimed = cur.fetchone() is not None
+
+                self._claims += 1
+                if self._claims % self.CLEANUP_EVERY == 0:
+                    cur.execute(
+                        "DELETE FROM webhook_events WHERE received_at < now() - make_interval(secs => %s);",
+                        (self.ttl,),
+                    )
+                cur.close()
+            healthy = True
+            return claimed
+        except Exception as e:
+            logger.error(f"webhook_events 查詢失敗，改用記憶體去重: {e}")
+            return self._fallback.claim(key)
+        finally:
+            self._put_back(conn, healthy)
+
+    def release(self, key):
+        self._fallback.release(key)
+        conn = self._acquire()
+        if conn is None:
+            return
+        healthy = False
+        try:
+            with conn:
+                cur = conn.cursor()
+                cur.execute("DELETE FROM webhook_events WHERE event_key = %s;", (key,))
+                cur.close()
+            healthy = True
+        except Exception as e:
+            logger.error(f"webhook_events 刪除失敗: {e}")
+        finally:
+            self._put_back(conn, healthy)
+
+    def __len__(self):
+        return len(self._fallback)
+
+
+def event_key(event):
+    """取得事件的唯一 key：優先使用 webhookEventId，其次 message id"""
+    webhook_event_id = getattr(event, "webhook_event_id", None)
+    if webhook_event_id:
+        return f"event:{webhook_event_id}"
+    message = getattr(event, "message", None)
+    if message is not None and getattr(message, "id", None):
+        return f"message:{message.id}"
+    return None
+
+
+class EventDeduplicator:
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.Lock()
+        self.counts = {"processed": 0, "duplicates": 0, "redeliveries": 0, "unkeyed": 0, "released": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def is_duplicate(self, event):
+        delivery_context = getattr(event, "delivery_context", None)
+        if delivery_context is not None and getattr(delivery_context, "is_redelivery", False):
+            self._count("redeliveries")
+
+        key = event_key(event)
+        if key is None:
+            self._count("unkeyed")
+            return False
+        if self.store.claim(key):
+            self._count("processed")
+            return False
+        self._count("duplicates")
+        logger.info(f"略過重複的 webhook 事件 {key}")
+        return True
+
+    def release(self, event):
+        key = event_key(event)
+        if key is None:
+            return
+        self.store.release(key)
+        self._count("released")
+
+    def deduplicated(self, func):
+        """
+        handler 裝飾器：重複事件直接略過，不重跑下載、推論與回覆；handler 失敗時釋放紀錄。
+        WebhookHandler 依參數個數決定是否多傳 destination，所以 wrapper 只收 event。
+        """
+        @wraps(func)
+        def wrapper(event):
+            if self.is_duplicate(event):
+                return None
+            try:
+                return func(event)
+            except Exception:
+                self.release(event)
+                raise
+        return wrapper
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counts)
+        stats["store"] = type(self.store).__name__
+        stats["tracked"] = len(self.store)
+        return stats
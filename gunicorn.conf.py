@@ -0,0 +1,99 @@
+# ============= 正式環境 gunicorn 設定 ===============
+# 啟動方式：gunicorn -c gunicorn.conf.py app:app
+#
+# - preload_app：master 先 import app.py（載入 Keras 模型、營養成分表、食譜索引）再 fork，
+#   worker 透過 copy-on-write 共用這些記憶體分頁，不必每個 worker 各載一份
+# - TensorFlow 執行緒數依 worker 數平分 CPU，避免 N 個 worker 各開滿 CPU 數的執行緒互搶
+# - 可用環境變數調整：WEB_CONCURRENCY、GUNICORN_THREADS、GUNICORN_TIMEOUT、
+#   TF_NUM_INTRAOP_THREADS、TF_NUM_INTEROP_THREADS
+import gc
+import glob
+import multiprocessing
+import os
+import sys
+
+cpu_count = multiprocessing.cpu_count()
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", min(4, cpu_count)))
+threads = int(os.getenv("GUNICORN_THREADS", 1))
+worker_class = "gthread" if threads > 1 else "sync"
+# 模型推論與圖片下載可能超過預設的 30 秒
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 60))
+graceful_timeout = 30
+keepalive = 5
+preload_app = True
+
+# 定期重啟 worker，避免長時間執行後記憶體碎片化讓共用分頁越來越少
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 2000))
+max_requests_jitter = 200
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
+
+# TensorFlow 在建立第一個 context 時讀取這些環境變數；
+# preload 時模型在 master 載入，所以必須在 import app 之前（也就是這個設定檔裡）設定。
+intra_op_threads = max(1, cpu_count // (workers * threads))
+os.environ.setdefault("TF_NUM_INTRAOP_THREADS", str(intra_op_threads))
+os.environ.setdefault("TF_NUM_INTEROP_THREADS", "1")
+os.environ.setdefault("OMP_NUM_THREADS", os.environ["TF_NUM_INTRAOP_THREADS"])
+os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+
+# 記憶體版的 webhook 去重紀錄每個 worker 各一份，LINE 重送的事件可能被分到別的 worker；
+# 多 worker 時預設改用 Postgres（init/91_webhook_events.sql）共用紀錄
+# 使用者最後辨識的蔬菜同理，「食譜」後續訊息可能由另一個 worker 處理（init/92_user_state.sql）
+if workers > 1:
+    os.environ.setdefault("WEBHOOK_DEDUP_BACKEND", "postgres")
+    os.environ.setdefault("USER_STATE_BACKEND", "postgres")
+
+# 多 worker 共用的 Prometheus 指標目錄，啟動時清空上次留下的檔案；
+# 同樣要在 preload import app 之前做，否則會刪掉 master 剛建立的指標檔
+multiproc_dir = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+if multiproc_dir:
+    os.makedirs(multiproc_dir, exist_ok=True)
+    for path in glob.glob(os.path.join(multiproc_dir, "*.db")):
+        os.remove(path)
+
+
+def when_ready(server):
+    # app 已在 master 載入完成；把目前所有物件移到 permanent generation，
+    # 之後 worker 的 GC 不會掃描（寫入 refcount 以外的 GC header）這些物件，減少 copy-on-write
+    gc.freeze()
+    server.log.info(
+        f"Preloaded app, frozen {gc.get_freeze_count()} objects; "
+        f"workers={workers} threads={threads} "
+        f"TF intra_op={os.environ['TF_NUM_INTRAOP_THREADS']} inter_op={os.environ['TF_NUM_INTEROP_THREADS']}"
+    )
+    if workers > 1 and os.environ.get("WEBHOOK_DEDUP_BACKEND") != "postgres":
+        server.log.warning(
+            f"WEBHOOK_DEDUP_BACKEND={os.environ.get('WEBHOOK_DEDUP_BACKEND')} with {workers} workers: "
+            "redelivered LINE events routed to another worker will not be deduplicated"
+        )
+    if workers > 1 and os.environ.get("USER_STATE_BACKEND") != "postgres":
+        server.log.warning(
+            f"USER_STATE_BACKEND={os.environ.get('USER_STATE_BACKEND')} with {workers} workers: "
+            "recipe follow-ups routed to another worker will not see the last recognized vegetable"
+        )
+
+
+def post_fork(server, worker):
+    server.log.info(f"Worker spawned (pid: {worker.pid})")
+
+
+def worker_exit(server, worker):
+    # worker 因 max_requests 或關機結束時，先把 LINE 發送佇列裡的訊息送完
+    app_module = sys.modules.get("app")
+    line_sender = getattr(app_module, "line_sender", None)
+    if line_sender is not None and not line_sender.drain():
+        server.log.warning(f"Worker {worker.pid} exited with unsent LINE messages")
+    # 最後停止日誌背景執行緒，佇列中的日誌寫完才結束
+    log_queue_handler = getattr(app_module, "log_queue_handler", None)
+    if log_queue_handler is not None:
+        log_queue_handler.stop()
+
+
+def child_exit(server, worker):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
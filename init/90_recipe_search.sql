@@ -0,0 +1,36 @@
+-- ============= 食譜關鍵字搜尋索引 ===============
+-- 以 pg_trgm 的 GIN 索引加速 main_recipe.recipe 與 recipe_steps.description 的 ILIKE / 相似度查詢。
+-- trigram 以字元為單位切分，3 字以上的片段（「番茄炒」「地瓜葉」）不需要中文斷詞器就能走索引。
+-- 注意：pg_trgm 從少於 3 個字的 LIKE 片段取不出 trigram，「番茄」「豆腐」這類 2 字查詢
+-- 無法利用 trigram 索引，所以另外建立 recipe_bigrams() 的 tsvector 索引給 1～2 字查詢使用
+-- （見 recipe_search.SHORT_SEARCH_SQL）。
+-- 另外 pg_trgm 只把資料庫 LC_CTYPE 認定為文字的字元納入 trigram，LC_CTYPE=C 時中文會被略過，
+-- 請使用 UTF-8 的 locale（例如 C.UTF-8）。
+--
+-- 檔名以 90_ 開頭，確保在建立資料表的初始化腳本之後執行。
+-- 已經初始化過的資料庫不會再跑 docker-entrypoint-initdb.d，請手動執行：
+--   docker exec -i postgres psql -U $POSTGRES_USER -d $POSTGRES_DB < init/90_recipe_search.sql
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS idx_main_recipe_recipe_trgm
+    ON main_recipe USING gin (recipe gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_recipe_steps_description_trgm
+    ON recipe_steps USING gin (description gin_trgm_ops);
+
+-- 每個位置取 2 個字當作 token，最後一個字單獨成為 token，讓 1 字查詢也能用前綴比對
+CREATE OR REPLACE FUNCTION recipe_bigrams(body text) RETURNS tsvector
+    LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS $$
+    SELECT coalesce(array_to_tsvector(array_agg(DISTINCT lower(substr(body, i, 2)))), ''::tsvector)
+    FROM generate_series(1, char_length(body)) AS i
+$$;
+
+CREATE INDEX IF NOT EXISTS idx_main_recipe_recipe_bigram
+    ON main_recipe USING gin (recipe_bigrams(recipe));
+
+CREATE INDEX IF NOT EXISTS idx_recipe_steps_description_bigram
+    ON recipe_steps USING gin (recipe_bigrams(description));
+
+ANALYZE main_recipe;
+ANALYZE recipe_steps;
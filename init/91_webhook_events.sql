@@ -0,0 +1,13 @@
+-- ============= Webhook 事件去重 ===============
+-- WEBHOOK_DEDUP_BACKEND=postgres 時，多個 worker 共用這張表判斷事件是否已處理過。
+-- 過期紀錄由 app 定期刪除（見 event_dedup.PostgresEventStore）。
+-- 已初始化的資料庫請手動執行：
+--   docker exec -i postgres psql -U $POSTGRES_USER -d $POSTGRES_DB < init/91_webhook_events.sql
+
+CREATE TABLE IF NOT EXISTS webhook_events (
+    event_key   text PRIMARY KEY,
+    received_at timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_webhook_events_received_at
+    ON webhook_events (received_at);
@@ -0,0 +1,12 @@
+-- ============= 使用者對話狀態 ===============
+-- USER_STATE_BACKEND=postgres 時保存每位使用者最後辨識/查詢的蔬菜，
+-- 讓重啟或換 worker 後「食譜」等後續訊息仍能接續（gunicorn 多 worker 時預設啟用）。
+-- 已初始化的資料庫請手動執行：
+--   docker exec -i postgres psql -U $POSTGRES_USER -d $POSTGRES_DB < init/92_user_state.sql
+
+CREATE TABLE IF NOT EXISTS user_state (
+    user_id        text PRIMARY KEY,
+    last_vege_name text,
+    last_vege_id   integer,
+    updated_at     timestamptz NOT NULL DEFAULT now()
+);
@@ -0,0 +1,274 @@
+import atexit
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from collections import deque
+
+import urllib3
+from linebot.v3.messaging import ApiClient, Configuration, MessagingApi
+from linebot.v3.messaging.exceptions import ApiException
+from linebot.v3.messaging.models import PushMessageRequest, ReplyMessageRequest
+
+# ============= LINE 訊息背景發送 ===============
+# handler 只負責把要回覆的訊息丟進有上限的佇列，由背景 worker 送出，
+# webhook 請求可以立即回 200。
+# - 共用一個 ApiClient，urllib3 連線池大小由 LINE_HTTP_POOL_SIZE 決定
+# - 429 / 5xx 與連線錯誤、逾時以指數退避重試，有 Retry-After 時以其為準
+# - reply token 失效（逾時或 LINE 回 Invalid reply token）時改用 push message 補送，
+#   push 帶 X-Line-Retry-Key，重試不會重複發送
+# - 記錄送出延遲與失敗次數，供 stats() 查詢；on_delivered callback 可另外送到 Prometheus
+# - worker 結束前以 drain() 送完佇列（gunicorn worker_exit 與 atexit）
+
+logger = logging.getLogger(__name__)
+
+# status 0 是 SDK 包裝的 SSL / 連線層錯誤
+RETRYABLE_STATUS = {0, 429, 500, 502, 503, 504}
+# LINE 的 reply token 約 1 分鐘後失效，保守一點提早改用 push
+REPLY_TOKEN_TTL = 50.0
+LATENCY_WINDOW = 1000
+
+
+class LineMessageSender:
+    def __init__(
+        self,
+        access_token,
+        host=None,
+        workers=None,
+        queue_size=None,
+        pool_size=None,
+        max_retries=None,
+        backoff_base=0.5,
+        backoff_max=8.0,
+        request_timeout=None,
+        drain_timeout=None,
+        on_delivered=None,
+    ):
+        self.workers = workers or int(os.getenv("LINE_SENDER_WORKERS", 4))
+        self.queue_size = queue_size or int(os.getenv("LINE_SENDER_QUEUE_SIZE", 1000))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("LINE_SENDER_MAX_RETRIES", 4))
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # on_delivered(outcome, queue_wait, elapsed)：每則訊息處理完後呼叫，outcome 為 sent / failed
+        self.on_delivered = on_delivered
+        self.request_timeout = request_timeout or float(os.getenv("LINE_SENDER_REQUEST_TIMEOUT", 10))
+        # 要比 gunicorn 的 graceful_timeout（30 秒）短
+        self.drain_timeout = drain_timeout or float(os.getenv("LINE_SENDER_DRAIN_TIMEOUT", 20))
+
+        # Configuration.host 是唯讀 property，只能在建構時指定
+        configuration = Configuration(host=host or "https://api.line.me", access_token=access_token)
+        # 連線池至少要跟 worker 數一樣大，否則 worker 會互相等連線
+        configuration.connection_pool_maxsize = pool_size or int(
+            os.getenv("LINE_HTTP_POOL_SIZE", max(self.workers, 10))
+        )
+        self.api_client = ApiClient(configuration)
+        self.messaging_api = MessagingApi(self.api_client)
+
+        self._queue = None
+        self._threads = []
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._counters = {
+            "enqueued": 0,
+            "sent": 0,
+            "failed": 0,
+            "retried": 0,
+            "push_fallback": 0,
+            "sent_inline": 0,
+            "no_recipient": 0,
+        }
+
+    # ---------- worker 管理 ----------
+    def _ensure_started(self):
+        # 以 pid 判斷：pre-fork 部署時 master 建立的 thread 不會跟著 fork 到 worker
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self.queue_size)
+            self._threads = []
+            for i in range(self.workers):
+                thread = threading.Thread(
+                    target=self._worker, name=f"line-sender-{i}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+            self._pid = os.getpid()
+            atexit.register(self.drain)
+
+    def drain(self, timeout=None):
+        """等待佇列中的訊息送完，回傳是否全部處理完；worker 結束前呼叫"""
+        if self._pid != os.getpid() or self._queue is None:
+            return True
+        deadline = time.monotonic() + (timeout if timeout is not None else self.drain_timeout)
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logger.warning(f"LINE 發送佇列尚有 {self._queue.unfinished_tasks} 則訊息未送出")
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._deliver(job)
+            except Exception as e:
+                logger.error(f"LINE 訊息發送發生未預期錯誤: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _count(self, name, value=1):
+        with self._stats_lock:
+            self._counters[name] += value
+
+    # ---------- 發送 ----------
+    def reply(self, event, messages):
+        """
+        非同步回覆 event。佇列滿時直接在呼叫端同步送出，確保訊息不會被丟掉。
+        """
+        source = getattr(event, "source", None)
+        job = {
+            "reply_token": event.reply_token,
+            # push 補送的對象：群組、聊天室優先，其次是使用者
+            "to": (
+                getattr(source, "group_id", None)
+                or getattr(source, "room_id", None)
+                or getattr(source, "user_id", None)
+            ),
+            "messages": messages,
+            "enqueued_at": time.monotonic(),
+            "retry_key": str(uuid.uuid4()),
+        }
+        self._ensure_started()
+        self._count("enqueued")
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            logger.warning("LINE 發送佇列已滿，改為同步發送")
+            self._count("sent_inline")
+            self._deliver(job)
+
+    def _backoff(self, attempt, error):
+        retry_after = None
+        headers = getattr(error, "headers", None)
+        if headers:
+            retry_after = headers.get("Retry-After")
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        delay = min(self.backoff_base * (2 ** attempt), self.backoff_max)
+        return delay * random.uniform(0.5, 1.0)  # jitter，避免所有 worker 同時重試
+
+    def _call_with_retry(self, send):
+        """回傳 None 表示成功，否則回傳最後一次的例外"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                send()
+                return None
+            except ApiException as e:
+                if e.status not in RETRYABLE_STATUS or attempt == self.max_retries:
+                    return e
+                error = e
+            except urllib3.exceptions.HTTPError as e:
+                # 連線失敗、逾時：與 5xx 一樣重試
+                if attempt == self.max_retries:
+                    return e
+                error = e
+            except Exception as e:
+                # 其他錯誤無法判斷訊息是否已送達，不重試以免重複發送
+                return e
+            self._count("retried")
+            time.sleep(self._backoff(attempt, error))
+        return None
+
+    @staticmethod
+    def _is_invalid_reply_token(error):
+        # 訊息內容不合法也會回 400，只有 reply token 無效時才改用 push，避免浪費 push 額度
+        if not isinstance(error, ApiException) or error.status != 400:
+            return False
+        body = error.body.decode("utf-8", "replace") if isinstance(error.body, bytes) else (error.body or "")
+        return "invalid reply token" in body.lower()
+
+    def _deliver(self, job):
+        start = time.monotonic()
+        queue_wait = start - job["enqueued_at"]
+        error = None
+        reply_token_valid = queue_wait < REPLY_TOKEN_TTL
+
+        # 回應內容用不到，_preload_content=False 略過反序列化
+        if reply_token_valid:
+            error = self._call_with_retry(
+                lambda: self.messaging_api.reply_message_with_http_info(
+                    ReplyMessageRequest(reply_token=job["reply_token"], messages=job["messages"]),
+                    _preload_content=False,
+                    _request_timeout=self.request_timeout,
+                )
+            )
+
+        # reply token 已逾時，或 LINE 回 Invalid reply token 時改用 push
+        if not reply_token_valid or self._is_invalid_reply_token(error):
+            if job["to"]:
+                self._count("push_fallback")
+                error = self._call_with_retry(
+                    lambda: self.messaging_api.push_message_with_http_info(
+                        PushMessageRequest(to=job["to"], messages=job["messages"]),
+                        x_line_retry_key=job["retry_key"],
+                        _preload_content=False,
+                        _request_timeout=self.request_timeout,
+                    )
+                )
+            else:
+                self._count("no_recipient")
+                if error is None:
+                    error = RuntimeError("reply token 已逾時，且沒有可以 push 的對象")
+
+        elapsed = time.monotonic() - start
+        with self._stats_lock:
+            self._latencies.append(elapsed)
+            if error is None:
+                self._counters["sent"] += 1
+            else:
+                self._counters["failed"] += 1
+        if self.on_delivered is not None:
+            try:
+                self.on_delivered("sent" if error is None else "failed", queue_wait, elapsed)
+            except Exception as e:
+                logger.error(f"on_delivered callback 失敗: {e}")
+        if error is not None:
+            if isinstance(error, ApiException):
+                logger.error(f"LINE 訊息發送失敗 status={error.status}: {error.body}")
+            else:
+                logger.error(f"LINE 訊息發送失敗: {type(error).__name__}: {error}")
+
+    # ---------- 統計 ----------
+    def stats(self):
+        with self._stats_lock:
+            latencies = sorted(self._latencies)
+            counters = dict(self._counters)
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 2)
+
+        counters.update({
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "queue_size": self.queue_size,
+            "workers": self.workers,
+            "latency_ms_p50": percentile(0.50),
+            "latency_ms_p95": percentile(0.95),
+            "latency_ms_p99": percentile(0.99),
+        })
+        return counters
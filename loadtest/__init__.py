@@ -0,0 +1,15 @@
+"""
+端對端壓力測試工具。
+
+- payloads：產生帶正確 X-Line-Signature 的 LINE webhook（文字、圖片、postback）
+- stubs：本機的 LINE Messaging / Content API 與 MinIO(S3) 替身
+- runner：依情境以指定並行數打 /callback、/predict、/api/*，輸出吞吐量與延遲分位數
+
+典型流程：
+    python -m loadtest.stubs --port 8090                      # 啟動替身
+    LINE_API_HOST=http://127.0.0.1:8090 \\
+    LINE_DATA_API_HOST=http://127.0.0.1:8090 \\
+    MINIO_ENDPOINT=http://127.0.0.1:8090 \\
+    gunicorn -c gunicorn.conf.py app:app                      # 以替身啟動 app
+    python -m loadtest.runner --base-url http://127.0.0.1:5000 --concurrency 16 --duration 30
+"""
@@ -0,0 +1,71 @@
+import base64
+import hashlib
+import hmac
+import json
+import time
+import uuid
+
+# ============= LINE webhook payload 產生器 ===============
+# 與 WebhookHandler 驗證方式相同：X-Line-Signature = base64(HMAC-SHA256(channel secret, body))。
+# 每個事件都產生新的 webhookEventId，避免被 event_dedup 當成重送略過；
+# 未指定 user_id 時也每次產生新的使用者，避免圖片情境被每位使用者的 token bucket 限流。
+
+
+def sign(body, channel_secret):
+    digest = hmac.new(channel_secret.encode("utf-8"), body.encode("utf-8"), hashlib.sha256).digest()
+    return base64.b64encode(digest).decode("utf-8")
+
+
+def random_user_id():
+    return f"U{uuid.uuid4().hex}"
+
+
+def _base_event(event_type, user_id=None):
+    user_id = user_id or random_user_id()
+    return {
+        "type": event_type,
+        "mode": "active",
+        "timestamp": int(time.time() * 1000),
+        "source": {"type": "user", "userId": user_id},
+        "webhookEventId": uuid.uuid4().hex.upper()[:26],
+        "deliveryContext": {"isRedelivery": False},
+        "replyToken": uuid.uuid4().hex,
+    }
+
+
+def text_event(text, user_id=None):
+    event = _base_event("message", user_id)
+    event["message"] = {
+        "type": "text",
+        "id": str(uuid.uuid4().int)[:18],
+        "quoteToken": uuid.uuid4().hex,
+        "text": text,
+    }
+    return event
+
+
+def image_event(user_id=None):
+    event = _base_event("message", user_id)
+    event["message"] = {
+        "type": "image",
+        "id": str(uuid.uuid4().int)[:18],
+        "quoteToken": uuid.uuid4().hex,
+        "contentProvider": {"type": "line"},
+    }
+    return event
+
+
+def postback_event(data, user_id=None):
+    event = _base_event("postback", user_id)
+    event["postback"] = {"data": data}
+    return event
+
+
+def webhook_request(events, channel_secret, destination="Uloadtestbot"):
+    """回傳 (body 字串, headers)，可直接 POST 到 /callback"""
+    body = json.dumps({"destination": destination, "events": events}, ensure_ascii=False)
+    headers = {
+        "Content-Type": "application/json; charset=utf-8",
+        "X-Line-Signature": sign(body, channel_secret),
+    }
+    return body, headers
@@ -0,0 +1,251 @@
+"""
+以指定並行數對 app 執行各壓測情境，輸出每個情境的吞吐量與延遲分位數。
+
+app 需以替身設定啟動（LINE_API_HOST、LINE_DATA_API_HOST、MINIO_ENDPOINT 指向 loadtest.stubs），
+並使用與本程式相同的 LINE_CHANNEL_SECRET，簽章才會通過。
+
+用法：
+    python -m loadtest.runner --base-url http://127.0.0.1:5000 --concurrency 16 --duration 30
+    python -m loadtest.runner --scenarios text_nutrient image --requests 500 --start-stubs
+    python -m loadtest.runner --max-p95-ms 800 --json results.json   # 超過門檻時 exit code 1
+    python -m loadtest.runner --stub-url http://127.0.0.1:8090       # 另外確認 LINE 回覆真的送到替身
+
+webhook 情境在有替身時（--start-stubs 或 --stub-url）會比對替身 /_stats 的 reply/push 次數，
+/callback 回 200 但回覆沒有送出也算失敗。
+"""
+import argparse
+import base64
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from dotenv import load_dotenv
+
+from loadtest.payloads import image_event, postback_event, text_event, webhook_request
+from loadtest.stubs import ROOT_DIR, start_stub_server
+
+
+def _webhook(events_factory):
+    def build(ctx):
+        body, headers = webhook_request(events_factory(), ctx["channel_secret"])
+        return "POST", "/callback", {"data": body.encode("utf-8"), "headers": headers}
+    # 每個事件都會回覆一則訊息，可用替身的 /_stats 確認
+    build.expects_reply = True
+    return build
+
+
+def _get(path):
+    def build(ctx):
+        return "GET", path, {}
+    return build
+
+
+def _predict(ctx):
+    return "POST", "/predict", {"json": {"image": ctx["image_b64"]}}
+
+
+# 情境名稱 -> 產生 (method, path, requests kwargs) 的函式
+SCENARIOS = {
+    "text_nutrient": _webhook(lambda: [text_event("蛋白質")]),
+    "text_compound": _webhook(lambda: [text_event("高蛋白 低鈉")]),
+    "text_vegetable": _webhook(lambda: [text_event("菠菜")]),
+    "text_ingredients": _webhook(lambda: [text_event("食材：高麗菜 蒜頭")]),
+    "image": _webhook(lambda: [image_event()]),
+    "postback_recipes": _webhook(lambda: [postback_event("action=get_recipes&veg_id=1")]),
+    "predict": _predict,
+    "api_vegetables": _get("/api/vegetables"),
+    "api_vegetable_detail": _get("/api/vegetables/1"),
+    "api_recipes": _get("/api/recipes/1"),
+    "api_recipe_search": _get("/api/recipes/search?q=%E7%82%92"),
+    "api_nutrient_query": _get("/api/nutrients/query?q=%E9%AB%98%E8%9B%8B%E7%99%BD"),
+    "api_csv": _get("/api/csv/vege_nutrition_new.csv"),
+    "api_dataset": _get("/api/datasets/nutrition?columns=id,name_in_nutrition,iron_mg&where=iron_mg%3E1"),
+}
+
+
+SEND_PATHS = ("/v2/bot/message/reply", "/v2/bot/message/push")
+
+
+def delivered_count(stub_url):
+    """替身收到且回 200 的 reply/push 次數（429 的嘗試不算）"""
+    counts = requests.get(f"{stub_url}/_stats", timeout=5).json()
+    return sum(counts.get(path, 0) - counts.get(f"{path} 429", 0) for path in SEND_PATHS)
+
+
+def wait_for_deliveries(stub_url, baseline, expected, timeout):
+    """回覆由 app 的背景 sender 非同步送出，等到數量足夠或逾時，回傳實際送達數"""
+    deadline = time.monotonic() + timeout
+    while True:
+        delivered = delivered_count(stub_url) - baseline
+        if delivered >= expected or time.monotonic() >= deadline:
+            return delivered
+        time.sleep(0.2)
+
+
+def run_scenario(name, build, base_url, ctx, concurrency, duration=None, n_requests=None):
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=concurrency))
+    latencies, statuses = [], {}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration if duration else None
+    remaining = [n_requests] if n_requests else None
+
+    def take_ticket():
+        if deadline is not None:
+            return time.monotonic() < deadline
+        with lock:
+            if remaining[0] <= 0:
+                return False
+            remaining[0] -= 1
+            return True
+
+    def worker():
+        while take_ticket():
+            method, path, kwargs = build(ctx)
+            start = time.perf_counter()
+            try:
+                response = session.request(method, base_url + path, timeout=60, **kwargs)
+                status = response.status_code
+            except requests.RequestException:
+                status = "error"
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies.append(elapsed)
+                statuses[status] = statuses.get(status, 0) + 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(worker) for _ in range(concurrency)]
+    wall = time.perf_counter() - start
+    # build 或請求以外的例外會讓 worker 提早結束，不能只看已完成的請求
+    errors = []
+    for future in futures:
+        try:
+            future.result()
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {e}")
+
+    latencies.sort()
+
+    def percentile(p):
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+
+    ok = sum(count for status, count in statuses.items() if status == 200)
+    return {
+        "scenario": name,
+        "requests": len(latencies),
+        "ok": ok,
+        "statuses": {str(k): v for k, v in statuses.items()},
+        "errors": errors,
+        "rps": len(latencies) / wall if wall else 0.0,
+        "mean_ms": statistics.mean(latencies) if latencies else None,
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "max_ms": latencies[-1] if latencies else None,
+    }
+
+
+def _fmt(value):
+    return f"{value:>9.1f}" if value is not None else f"{'-':>9}"
+
+
+def print_report(results):
+    print(f"{'scenario':<22}{'reqs':>7}{'ok':>7}{'req/s':>9}{'mean':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    for r in results:
+        print(
+            f"{r['scenario']:<22}{r['requests']:>7}{r['ok']:>7}{r['rps']:>9.1f}"
+            f"{_fmt(r['mean_ms'])}{_fmt(r['p50_ms'])}{_fmt(r['p95_ms'])}{_fmt(r['p99_ms'])}{_fmt(r['max_ms'])}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:5000")
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=sorted(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=8)
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--duration", type=float, help="每個情境執行秒數（預設 10）")
+    group.add_argument("--requests", type=int, help="每個情境的請求數")
+    parser.add_argument("--image", default=os.path.join(ROOT_DIR, "richmenu_vege.jpg"))
+    parser.add_argument("--start-stubs", action="store_true", help="同時在本程式內啟動 LINE / MinIO 替身")
+    parser.add_argument("--stub-port", type=int, default=8090)
+    parser.add_argument("--stub-latency-ms", type=float, default=0.0)
+    parser.add_argument("--stub-url", help="另外啟動的替身位址，用來確認 LINE 回覆已送達")
+    parser.add_argument("--delivery-timeout", type=float, default=30.0, help="等待回覆送達的秒數")
+    parser.add_argument("--json", help="另存結果為 JSON")
+    parser.add_argument("--max-p95-ms", type=float, help="任一情境 p95 超過此值即回傳 exit code 1")
+    parser.add_argument("--min-success-rate", type=float, default=0.99)
+    args = parser.parse_args()
+
+    load_dotenv()
+    channel_secret = os.getenv("LINE_CHANNEL_SECRET")
+    if not channel_secret:
+        parser.error("需要 LINE_CHANNEL_SECRET 才能產生簽章")
+
+    stub_server = None
+    if args.start_stubs:
+        stub_server, _ = start_stub_server(args.stub_port, latency_ms=args.stub_latency_ms)
+        print(f"替身已啟動於 http://127.0.0.1:{args.stub_port}")
+    stub_url = args.stub_url.rstrip("/") if args.stub_url else None
+    if stub_url is None and stub_server is not None:
+        stub_url = f"http://127.0.0.1:{args.stub_port}"
+
+    with open(args.image, "rb") as f:
+        image_b64 = base64.b64encode(f.read()).decode("utf-8")
+    ctx = {"channel_secret": channel_secret, "image_b64": image_b64}
+
+    duration = args.duration if args.requests is None else None
+    if duration is None and args.requests is None:
+        duration = 10.0
+
+    results = []
+    try:
+        for name in args.scenarios:
+            build = SCENARIOS[name]
+            check_delivery = stub_url is not None and getattr(build, "expects_reply", False)
+            baseline = delivered_count(stub_url) if check_delivery else None
+            result = run_scenario(
+                name, build, args.base_url.rstrip("/"), ctx,
+                args.concurrency, duration=duration, n_requests=args.requests,
+            )
+            result["delivered"] = (
+                wait_for_deliveries(stub_url, baseline, result["ok"], args.delivery_timeout)
+                if check_delivery else None
+            )
+            results.append(result)
+    finally:
+        if stub_server is not None:
+            stub_server.shutdown()
+
+    print_report(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    failed = []
+    for r in results:
+        if r["errors"]:
+            failed.append(f"{r['scenario']} 執行錯誤：{'; '.join(sorted(set(r['errors'])))}")
+        if not r["requests"]:
+            failed.append(f"{r['scenario']} 沒有完成任何請求")
+        elif r["ok"] / r["requests"] < args.min_success_rate:
+            failed.append(f"{r['scenario']} 成功率 {r['ok'] / r['requests']:.1%}")
+        if r["delivered"] is not None and r["delivered"] < r["ok"] * args.min_success_rate:
+            failed.append(f"{r['scenario']} LINE 回覆只送達 {r['delivered']}/{r['ok']}")
+        if args.max_p95_ms is not None and r["p95_ms"] is not None and r["p95_ms"] > args.max_p95_ms:
+            failed.append(f"{r['scenario']} p95 {r['p95_ms']:.1f}ms > {args.max_p95_ms}ms")
+    if failed:
+        print("未通過門檻：\n  " + "\n  ".join(failed))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+本機 LINE API 與 MinIO 替身。
+
+同一個 port 提供：
+  POST /v2/bot/message/reply、/v2/bot/message/push   -> 200 {}（可設定延遲與錯誤率）
+  GET  /v2/bot/message/<id>/content                  -> 圖片內容
+  GET  /<bucket>/<key>                               -> 從 --data-dir 讀檔（S3 path-style，預設 loadtest/data）
+  GET  /minio/health/live                            -> 200
+  GET  /_stats                                       -> 各路徑請求次數
+
+用法：
+    python -m loadtest.stubs --port 8090 --latency-ms 30 --error-rate 0.01
+"""
+import argparse
+import json
+import mimetypes
+import os
+import random
+import shutil
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 替身只提供這個目錄內的檔案，不直接開放專案根目錄（避免讀到 .env 等檔案）
+DEFAULT_DATA_DIR = os.path.join(ROOT_DIR, "loadtest", "data")
+# 預設資料目錄會放入的專案檔案（/api/csv 情境使用）
+BUNDLED_DATA_FILES = ("vege_nutrition_new.csv", "fresh_month.csv")
+# SDK 會把回應反序列化成 ReplyMessageResponse / PushMessageResponse，sentMessages 不可為空
+SEND_RESPONSE = b'{"sentMessages":[{"id":"1","quoteToken":"q"}]}'
+
+
+class StubState:
+    def __init__(self, image_path, data_dir, latency_ms=0.0, error_rate=0.0):
+        with open(image_path, "rb") as f:
+            self.image_bytes = f.read()
+        self.data_dir = data_dir
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.counts = Counter()
+        self._lock = threading.Lock()
+
+    def count(self, key):
+        with self._lock:
+            self.counts[key] += 1
+
+
+def make_handler(state):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass  # 壓測時不輸出每個請求
+
+        def _send(self, status, body=b"", content_type="application/json", headers=None):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _simulate_latency(self):
+            if state.latency_ms:
+                # 以指數分布模擬長尾延遲
+                time.sleep(random.expovariate(1000.0 / state.latency_ms))
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            self.rfile.read(length)
+            if self.path in ("/v2/bot/message/reply", "/v2/bot/message/push"):
+                state.count(self.path)
+                self._simulate_latency()
+                if random.random() < state.error_rate:
+                    state.count(f"{self.path} 429")
+                    self._send(429, b'{"message":"rate limited"}', headers={"Retry-After": "1"})
+                    return
+                self._send(200, SEND_RESPONSE)
+                return
+            self._send(404, b'{"message":"not found"}')
+
+        def do_GET(self):
+            path = self.path.split("?", 1)[0]
+            if path == "/_stats":
+                self._send(200, json.dumps(state.counts, ensure_ascii=False).encode("utf-8"))
+                return
+            if path == "/minio/health/live":
+                self._send(200)
+                return
+            if path.startswith("/v2/bot/message/") and path.endswith("/content"):
+                state.count("content")
+                self._simulate_latency()
+                self._send(200, state.image_bytes, content_type="image/jpeg")
+                return
+
+            # S3 path-style：/<bucket>/<key>，bucket 名稱忽略，key 對應到 data_dir 內的檔案
+            parts = unquote(path).lstrip("/").split("/", 1)
+            if len(parts) == 2:
+                state.count("s3")
+                local_path = os.path.realpath(os.path.join(state.data_dir, parts[1]))
+                inside = os.path.commonpath([local_path, state.data_dir]) == state.data_dir
+                if inside and os.path.isfile(local_path):
+                    with open(local_path, "rb") as f:
+                        body = f.read()
+                    content_type = mimetypes.guess_type(local_path)[0] or "application/octet-stream"
+                    self._send(200, body, content_type=content_type)
+                    return
+                # 沒有對應檔案的圖片一律回傳同一張，模擬 images/<蔬菜>.jpg
+                if parts[1].startswith("images/"):
+                    self._send(200, state.image_bytes, content_type="image/jpeg")
+                    return
+            self._send(
+                404,
+                b'<?xml version="1.0" encoding="UTF-8"?><Error><Code>NoSuchKey</Code></Error>',
+                content_type="application/xml",
+            )
+
+    return StubHandler
+
+
+def prepare_default_data_dir():
+    """把 BUNDLED_DATA_FILES 複製到 DEFAULT_DATA_DIR（來源較新時才覆寫）"""
+    os.makedirs(DEFAULT_DATA_DIR, exist_ok=True)
+    for filename in BUNDLED_DATA_FILES:
+        source = os.path.join(ROOT_DIR, filename)
+        target = os.path.join(DEFAULT_DATA_DIR, filename)
+        if os.path.exists(source) and (
+            not os.path.exists(target) or os.path.getmtime(target) < os.path.getmtime(source)
+        ):
+            shutil.copy2(source, target)
+    return DEFAULT_DATA_DIR
+
+
+def start_stub_server(port=8090, image_path=None, data_dir=None, latency_ms=0.0, error_rate=0.0):
+    """在背景執行緒啟動替身，回傳 (server, state)；呼叫 server.shutdown() 結束"""
+    state = StubState(
+        image_path or os.path.join(ROOT_DIR, "richmenu_vege.jpg"),
+        os.path.realpath(data_dir or prepare_default_data_dir()),
+        latency_ms=latency_ms,
+        error_rate=error_rate,
+    )
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(state))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="loadtest-stubs", daemon=True)
+    thread.start()
+    return server, state
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--image", help="content API 與 images/ 回傳的圖片，預設 richmenu_vege.jpg")
+    parser.add_argument("--data-dir", help="S3 key 對應的本機目錄，預設 loadtest/data（啟動時放入專案的 CSV）")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="LINE API 平均延遲")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="reply/push 回 429 的比例")
+    args = parser.parse_args()
+
+    server, _ = start_stub_server(args.port, args.image, args.data_dir, args.latency_ms, args.error_rate)
+    print(f"LINE / MinIO 替身已啟動：http://127.0.0.1:{args.port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import os
+import time
+
+import psycopg2.extensions
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client import multiprocess
+
+# ============= Prometheus 指標 ===============
+# 單一 process 時直接使用預設 registry；
+# gunicorn 多 worker 時設定 PROMETHEUS_MULTIPROC_DIR，各 worker 寫入共享目錄，
+# /metrics 由 MultiProcessCollector 彙整（gunicorn.conf.py 的 child_exit 負責清理）。
+
+# 直接以 python app.py 啟動時不會經過 gunicorn.conf.py，目錄可能還不存在
+if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+REQUEST_LATENCY = Histogram(
+    "vegebot_http_request_duration_seconds",
+    "HTTP 請求處理時間",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+STAGE_LATENCY = Histogram(
+    "vegebot_stage_duration_seconds",
+    "handler 內各階段處理時間",
+    ["handler", "stage"],
+    buckets=LATENCY_BUCKETS,
+)
+DB_QUERY_LATENCY = Histogram(
+    "vegebot_db_query_duration_seconds",
+    "資料庫查詢時間（依 SQL 指令分類）",
+    ["operation"],
+    buckets=LATENCY_BUCKETS,
+)
+DB_QUERY_ERRORS = Counter(
+    "vegebot_db_query_errors_total",
+    "資料庫查詢失敗次數",
+    ["operation"],
+)
+DB_CONNECT_LATENCY = Histogram(
+    "vegebot_db_connect_duration_seconds",
+    "建立資料庫連線時間",
+    buckets=LATENCY_BUCKETS,
+)
+MINIO_FETCH_LATENCY = Histogram(
+    "vegebot_minio_fetch_duration_seconds",
+    "從 MinIO 取檔時間",
+    ["kind", "outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+MODEL_INFERENCE_LATENCY = Histogram(
+    "vegebot_model_inference_duration_seconds",
+    "模型推論時間",
+    ["source"],
+    buckets=LATENCY_BUCKETS,
+)
+LINE_SEND_LATENCY = Histogram(
+    "vegebot_line_send_duration_seconds",
+    "LINE reply / push 實際送出時間（含重試）",
+    ["outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+LINE_QUEUE_WAIT = Histogram(
+    "vegebot_line_queue_wait_seconds",
+    "LINE 訊息在發送佇列中等待的時間",
+    buckets=LATENCY_BUCKETS,
+)
+LOG_RECORDS_DROPPED = Counter(
+    "vegebot_log_records_dropped_total",
+    "日誌佇列已滿而丟棄的筆數",
+)
+MODEL_INFERENCES = Counter(
+    "vegebot_model_inferences_total",
+    "模型推論次數",
+    ["source", "outcome"],
+)
+
+
+def stage(handler, name):
+    """
+    量測 handler 內某個階段，可當 context manager 或裝飾器使用：
+        with stage("image", "download"):
+            ...
+    """
+    return STAGE_LATENCY.labels(handler, name).time()
+
+
+def observe_line_delivery(outcome, queue_wait, elapsed):
+    """LineMessageSender 的 on_delivered callback"""
+    LINE_QUEUE_WAIT.observe(queue_wait)
+    LINE_SEND_LATENCY.labels(outcome).observe(elapsed)
+
+
+class TimedCursor(psycopg2.extensions.cursor):
+    """記錄每次查詢耗時的 cursor，透過 psycopg2.connect(cursor_factory=TimedCursor) 使用"""
+
+    @staticmethod
+    def _operation(query):
+        if isinstance(query, bytes):
+            query = query.decode("utf-8", "ignore")
+        elif not isinstance(query, str):
+            # psycopg2.sql.Composed 等物件
+            return "composed"
+        words = query.split(None, 1)
+        return words[0].upper() if words else "UNKNOWN"
+
+    def _timed(self, method, query, *args, **kwargs):
+        operation = self._operation(query)
+        start = time.perf_counter()
+        try:
+            return method(query, *args, **kwargs)
+        except Exception:
+            DB_QUERY_ERRORS.labels(operation).inc()
+            raise
+        finally:
+            DB_QUERY_LATENCY.labels(operation).observe(time.perf_counter() - start)
+
+    def execute(self, query, vars=None):
+        return self._timed(super().execute, query, vars)
+
+    def executemany(self, query, vars_list):
+        return self._timed(super().executemany, query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        return self._timed(super().copy_expert, sql, file, size)
+
+
+def render_metrics():
+    """回傳 (內容, content type) 給 /metrics 使用"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
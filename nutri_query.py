@@ -0,0 +1,265 @@
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+# ============= 多營養素條件查詢 ===============
+# 啟動時把 vege_nutrition_new.csv（有 Arrow IPC 檔時以 mmap 讀取）讀成一個 float 的 NumPy 陣列（列=蔬菜、欄=營養素），
+# 之後每次查詢只做向量化的布林遮罩與加權分數，不再逐列走 DataFrame。
+#
+# 支援的輸入，例如：
+#   "高蛋白 低鈉"           -> 蛋白質越高越好、鈉越低越好
+#   "鐵質>2 且 熱量<20"     -> 先用條件篩選，再依條件方向排序
+#   "高鈣 維生素C>=10"      -> 可混用
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+NUTRITION_CSV_PATH = os.path.join(BASE_DIR, "vege_nutrition_new.csv")
+FRESH_MONTH_CSV_PATH = os.path.join(BASE_DIR, "fresh_month.csv")
+
+# 中文營養素名稱（含常見說法）對應到 CSV 欄位
+NUTRIENT_ALIASES = {
+    "熱量": "calories_kcal",
+    "卡路里": "calories_kcal",
+    "水分": "water_g",
+    "水": "water_g",
+    "蛋白質": "protein_g",
+    "蛋白": "protein_g",
+    "脂肪": "fat_g",
+    "碳水化合物": "carb_g",
+    "碳水": "carb_g",
+    "膳食纖維": "fiber_g",
+    "纖維": "fiber_g",
+    "糖分": "sugar_g",
+    "糖": "sugar_g",
+    "鈉": "sodium_mg",
+    "鉀": "potassium_mg",
+    "鈣質": "calcium_mg",
+    "鈣": "calcium_mg",
+    "鎂": "magnesium_mg",
+    "鐵質": "iron_mg",
+    "鐵": "iron_mg",
+    "鋅": "zinc_mg",
+    "磷": "phosphorus_mg",
+    "維生素A": "vitamin_a_iu",
+    "維他命A": "vitamin_a_iu",
+    "維生素C": "vitamin_c_mg",
+    "維他命C": "vitamin_c_mg",
+    "維生素E": "vitamin_e_mg",
+    "維他命E": "vitamin_e_mg",
+    "維生素B1": "vitamin_b1_mg",
+    "維他命B1": "vitamin_b1_mg",
+    "葉酸": "folic_acid_ug",
+}
+
+UNIT_DISPLAY = {
+    "kcal": "大卡",
+    "g": "克",
+    "mg": "毫克",
+    "iu": "IU",
+    "ug": "微克",
+}
+
+# 「且」「和」「、」「,」「&」與空白都視為條件分隔；
+# 比較運算子前後的空白先去掉，「鐵質 > 2」才不會被拆成三段
+OPERATOR_SPACING_RE = re.compile(r"\s*(>=|<=|≥|≤|>|<|＞|＜|=)\s*")
+TERM_SEPARATOR_RE = re.compile(r"\s*(?:且|和|並且|以及|、|，|,|&|\s)\s*")
+COMPARISON_RE = re.compile(r"^(?P<name>.+?)(?P<op>>=|<=|≥|≤|>|<|＞|＜|=)(?P<value>\d+(?:\.\d+)?)$")
+
+OPERATORS = {
+    ">": np.greater,
+    "＞": np.greater,
+    ">=": np.greater_equal,
+    "≥": np.greater_equal,
+    "<": np.less,
+    "＜": np.less,
+    "<=": np.less_equal,
+    "≤": np.less_equal,
+    "=": np.isclose,
+}
+
+MAX_RESULTS = 12  # Flex Carousel 最多 12 個 bubble
+
+
+class NutrientQueryError(ValueError):
+    """查詢字串無法解析時拋出"""
+
+
+def _resolve_nutrient(name):
+    # 維生素字母統一大寫後再比對，例如「維生素c」
+    return NUTRIENT_ALIASES.get(name.strip().upper())
+
+
+def parse_query(text):
+    """
+    將查詢字串解析成條件清單。
+    回傳 [{'column': 欄位, 'op': 運算子或 None, 'value': 數值或 None, 'weight': +1/-1}, ...]
+    任何一段無法辨識就拋出 NutrientQueryError。
+    """
+    terms = []
+    text = OPERATOR_SPACING_RE.sub(r"\1", text.strip())
+    for token in TERM_SEPARATOR_RE.split(text):
+        if not token:
+            continue
+
+        match = COMPARISON_RE.match(token)
+        if match:
+            column = _resolve_nutrient(match.group("name"))
+            if column is None:
+                raise NutrientQueryError(f"無法辨識的營養成分：{match.group('name')}")
+            op = match.group("op")
+            # 大於類條件偏好數值高者，小於類條件偏好數值低者
+            weight = -1.0 if op in ("<", "<=", "＜", "≤") else 1.0
+            if op == "=":
+                weight = 0.0
+            terms.append({
+                "column": column,
+                "op": op,
+                "value": float(match.group("value")),
+                "weight": weight,
+            })
+            continue
+
+        if token[0] in ("高", "低") and len(token) > 1:
+            column = _resolve_nutrient(token[1:])
+            if column is None:
+                raise NutrientQueryError(f"無法辨識的營養成分：{token[1:]}")
+            terms.append({
+                "column": column,
+                "op": None,
+                "value": None,
+                "weight": 1.0 if token[0] == "高" else -1.0,
+            })
+            continue
+
+        raise NutrientQueryError(f"無法辨識的條件：{token}")
+
+    if not terms:
+        raise NutrientQueryError("查詢條件為空")
+    return terms
+
+
+def is_compound_query(text):
+    """
+    判斷文字是否為多條件查詢（每一段都帶「高/低」前綴或比較運算子）。
+    單純的「蛋白質」或「高麗菜」會解析失敗，仍交給原本的推薦與名稱搜尋處理。
+    """
+    try:
+        parse_query(text)
+    except NutrientQueryError:
+        return False
+    return True
+
+
+class NutrientTable:
+    """預先載入的營養成分表，查詢時只做 NumPy 向量運算"""
+
+    def __init__(self, nutrition_df, name_by_vege_id=None):
+        name_by_vege_id = name_by_vege_id or {}
+        self.columns = [
+            c for c in nutrition_df.columns
+            if c not in ("id", "name_in_nutrition", "vege_id")
+        ]
+        self.column_index = {c: i for i, c in enumerate(self.columns)}
+        self.values = nutrition_df[self.columns].to_numpy(dtype=np.float64)
+
+        # min-max 正規化後各營養素的單位才能相加
+        col_min = np.nanmin(self.values, axis=0)
+        col_range = np.nanmax(self.values, axis=0) - col_min
+        col_range[col_range == 0] = 1.0
+        self.normalized = np.nan_to_num((self.values - col_min) / col_range, nan=0.0)
+
+        self.records = []
+        for row in nutrition_df.to_dict("records"):
+            vege_id = int(row["vege_id"])
+            chinese_name = name_by_vege_id.get(vege_id, row["name_in_nutrition"])
+            self.records.append({
+                "id": vege_id,
+                "chinese_name": chinese_name,
+                # 營養資料庫的品名（如「甘藍平均值」）與常用名不同時當作別名顯示
+                "aliases": [row["name_in_nutrition"]] if chinese_name != row["name_in_nutrition"] else [],
+                "all_nutrients": {
+                    k: row[k] for k in ["id", "name_in_nutrition"] + self.columns
+                },
+            })
+
+    @classmethod
+    def from_csv(cls, nutrition_path=NUTRITION_CSV_PATH, fresh_month_path=FRESH_MONTH_CSV_PATH):
+        nutrition_df = pd.read_csv(nutrition_path)
+        name_by_vege_id = {}
+        if os.path.exists(fresh_month_path):
+            names = pd.read_csv(fresh_month_path)[["vege_id", "vege_name"]].drop_duplicates("vege_id")
+            name_by_vege_id = dict(zip(names["vege_id"].astype(int), names["vege_name"]))
+        return cls(nutrition_df, name_by_vege_id)
+
+    @classmethod
+    def from_columnar(cls):
+        """從 columnar.py 轉好的 Arrow IPC 檔（mmap）載入，不必再解析 CSV"""
+        from columnar import arrow_path, load_table
+
+        nutrition_df = load_table("nutrition").to_pandas()
+        name_by_vege_id = {}
+        if os.path.exists(arrow_path("season")):
+            names = load_table("season").select(["vege_id", "vege_name"]).to_pandas().drop_duplicates("vege_id")
+            name_by_vege_id = dict(zip(names["vege_id"].astype(int), names["vege_name"]))
+        return cls(nutrition_df, name_by_vege_id)
+
+    def evaluate(self, terms):
+        """回傳 (符合條件的列索引依分數排序, 分數陣列)"""
+        mask = np.ones(len(self.values), dtype=bool)
+        weights = np.zeros(len(self.columns))
+
+        for term in terms:
+            col = self.column_index[term["column"]]
+            if term["op"] is not None:
+                column_values = self.values[:, col]
+                # NaN 比較結果為 False，缺值的蔬菜自然被排除
+                with np.errstate(invalid="ignore"):
+                    mask &= OPERATORS[term["op"]](column_values, term["value"])
+            weights[col] += term["weight"]
+
+        scores = self.normalized @ weights
+        candidates = np.flatnonzero(mask)
+        order = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return order, scores
+
+    def query(self, text, limit=10):
+        terms = parse_query(text)
+        order, scores = self.evaluate(terms)
+        primary = terms[0]["column"]
+        unit_abbreviation = primary.split("_")[-1]
+        display_name = next(
+            (alias for alias, col in NUTRIENT_ALIASES.items() if col == primary), primary
+        )
+
+        results = []
+        # limit 為負數時切片會從尾端算起，先限制在 0 以上
+        for idx in order[: max(0, min(limit, MAX_RESULTS))]:
+            veg = dict(self.records[idx])
+            value = self.values[idx, self.column_index[primary]]
+            veg["nutrient_name"] = display_name
+            veg["nutrient_value"] = round(float(value), 2)
+            veg["unit"] = UNIT_DISPLAY.get(unit_abbreviation, "")
+            veg["score"] = round(float(scores[idx]), 4)
+            results.append(veg)
+        return results
+
+
+_table = None
+
+
+def get_nutrient_table():
+    """延遲載入並快取營養成分表"""
+    global _table
+    if _table is None:
+        try:
+            _table = NutrientTable.from_columnar()
+        except (ImportError, OSError):
+            # 尚未轉換或未安裝 pyarrow 時退回讀 CSV
+            _table = NutrientTable.from_csv()
+    return _table
+
+
+def query_vegetables_by_conditions(text, limit=10):
+    """對外介面：解析多條件查詢並回傳蔬菜清單（格式與 nutri_rec 回傳一致）"""
+    return get_nutrient_table().query(text, limit=limit)
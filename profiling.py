@@ -0,0 +1,249 @@
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import threading
+import time
+from collections import defaultdict, deque
+
+from flask import g, request
+
+# ============= 請求取樣 profiler ===============
+# 依比例對 /callback、/predict、/api/* 的請求開啟 cProfile：
+# - 超過延遲門檻的請求，把完整 profile 存到 PROFILE_DIR（可用 snakeviz / pstats 開啟）
+# - 每個取樣請求的熱點函式（依 tottime）累積在時間視窗內，可由 admin API 查詢
+# 預設關閉（PROFILE_SAMPLE_RATE=0），可透過環境變數或 /api/admin/profiling 開啟。
+# cProfile 只追蹤目前的執行緒；LINE handler 在請求執行緒中同步執行，背景發送的 worker 不在範圍內。
+#
+# 多 worker：/api/admin/profiling 的設定寫到 PROFILE_DIR/settings.json，各 worker 每秒最多檢查一次
+# 檔案是否更新並套用，所以所有 worker 都會依相同比例取樣；檔案存在時優先於環境變數，刪除即回到環境變數設定。
+# 慢請求 profile 檔同樣放在共用目錄；熱點函式的時間視窗則只在各 worker 的記憶體內，回應會附上 pid。
+
+logger = logging.getLogger(__name__)
+
+PROFILED_PATHS = re.compile(r"^/(callback|predict|api/)")
+TOP_FUNCTIONS_PER_PROFILE = 50
+SETTINGS_FILE = "settings.json"
+SETTINGS_CHECK_INTERVAL = 1.0
+
+
+class RequestProfiler:
+    def __init__(self, app=None):
+        self.sample_rate = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+        self.slow_ms = float(os.getenv("PROFILE_SLOW_MS", 1000))
+        self.profile_dir = os.getenv("PROFILE_DIR", "profiles")
+        self.window_seconds = int(os.getenv("PROFILE_WINDOW_SECONDS", 900))
+        self.max_files = int(os.getenv("PROFILE_MAX_FILES", 200))
+
+        self._lock = threading.Lock()
+        # (取樣時間, route, 耗時 ms, {函式: (呼叫次數, tottime, cumtime)})
+        self._samples = deque()
+        self.counts = {"sampled": 0, "slow_saved": 0}
+        self._settings_mtime = None
+        self._settings_checked_at = 0.0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    @property
+    def enabled(self):
+        return self.sample_rate > 0
+
+    @property
+    def settings_path(self):
+        return os.path.join(self.profile_dir, SETTINGS_FILE)
+
+    def configure(self, sample_rate=None, slow_ms=None, window_seconds=None):
+        """調整設定並寫入共用的 settings.json，其他 worker 會在下一個請求時套用"""
+        self._apply(sample_rate, slow_ms, window_seconds)
+        os.makedirs(self.profile_dir, exist_ok=True)
+        tmp_path = f"{self.settings_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"sample_rate": self.sample_rate, "slow_ms": self.slow_ms, "window_seconds": self.window_seconds},
+                f,
+            )
+        os.replace(tmp_path, self.settings_path)
+        self._settings_mtime = os.stat(self.settings_path).st_mtime_ns
+
+    def _apply(self, sample_rate=None, slow_ms=None, window_seconds=None):
+        if sample_rate is not None:
+            self.sample_rate = min(1.0, max(0.0, float(sample_rate)))
+        if slow_ms is not None:
+            self.slow_ms = float(slow_ms)
+        if window_seconds is not None:
+            self.window_seconds = int(window_seconds)
+
+    def _sync_settings(self):
+        """其他 worker 更新過 settings.json 時套用；每 SETTINGS_CHECK_INTERVAL 秒最多 stat 一次"""
+        now = time.monotonic()
+        if now - self._settings_checked_at < SETTINGS_CHECK_INTERVAL:
+            return
+        self._settings_checked_at = now
+        try:
+            mtime = os.stat(self.settings_path).st_mtime_ns
+        except OSError:
+            return
+        if mtime == self._settings_mtime:
+            return
+        try:
+            with open(self.settings_path, encoding="utf-8") as f:
+                settings = json.load(f)
+            self._apply(settings.get("sample_rate"), settings.get("slow_ms"), settings.get("window_seconds"))
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"讀取 profiler 設定失敗: {e}")
+        self._settings_mtime = mtime
+
+    # ---------- Flask hooks ----------
+    def _before_request(self):
+        self._sync_settings()
+        if not self.enabled or not PROFILED_PATHS.match(request.path):
+            return
+        if random.random() >= self.sample_rate:
+            return
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # 已有其他 profiler 在這個執行緒上運作
+            return
+        g.profiler = profiler
+        g.profile_start = time.perf_counter()
+
+    def _after_request(self, response):
+        profiler = g.pop("profiler", None)
+        if profiler is None:
+            return response
+        profiler.disable()
+        elapsed_ms = (time.perf_counter() - g.pop("profile_start")) * 1000
+        route = request.url_rule.rule if request.url_rule else request.path
+
+        try:
+            self._record(profiler, route, elapsed_ms)
+            if elapsed_ms >= self.slow_ms:
+                self._save(profiler, route, elapsed_ms)
+        except Exception as e:
+            logger.error(f"儲存 profile 失敗: {e}")
+        return response
+
+    # ---------- 彙整 ----------
+    def _record(self, profiler, route, elapsed_ms):
+        stats = pstats.Stats(profiler)
+        entries = sorted(
+            stats.stats.items(), key=lambda item: item[1][2], reverse=True
+        )[:TOP_FUNCTIONS_PER_PROFILE]
+        functions = {
+            self._format_function(func): (nc, tt, ct)
+            for func, (cc, nc, tt, ct, callers) in entries
+        }
+        now = time.time()
+        with self._lock:
+            self._samples.append((now, route, elapsed_ms, functions))
+            self.counts["sampled"] += 1
+            self._expire(now)
+
+    def _expire(self, now):
+        while self._samples and now - self._samples[0][0] > self.window_seconds:
+            self._samples.popleft()
+
+    @staticmethod
+    def _format_function(func):
+        filename, line, name = func
+        if filename == "~":
+            return name  # 內建函式，例如 <built-in method ...>
+        return f"{os.path.basename(filename)}:{line}({name})"
+
+    def _save(self, profiler, route, elapsed_ms):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        safe_route = re.sub(r"[^A-Za-z0-9_]+", "_", route).strip("_") or "root"
+        filename = f"{time.strftime('%Y%m%d-%H%M%S')}_{os.getpid()}_{safe_route}_{elapsed_ms:.0f}ms.prof"
+        profiler.dump_stats(os.path.join(self.profile_dir, filename))
+        with self._lock:
+            self.counts["slow_saved"] += 1
+        self._prune_files()
+
+    def _prune_files(self):
+        files = sorted(
+            (os.path.join(self.profile_dir, f) for f in os.listdir(self.profile_dir) if f.endswith(".prof")),
+            key=os.path.getmtime,
+        )
+        for path in files[: max(0, len(files) - self.max_files)]:
+            os.remove(path)
+
+    def hot_functions(self, limit=20, window_seconds=None, route=None):
+        """
+        時間視窗內所有取樣請求的函式耗時加總，依 tottime 排序。
+        超過設定 window_seconds 的樣本已被淘汰，所以 window_seconds 最多取設定值，回應中是實際使用的視窗。
+        """
+        window = min(window_seconds or self.window_seconds, self.window_seconds)
+        now = time.time()
+        totals = defaultdict(lambda: [0, 0.0, 0.0])
+        n_samples = 0
+        with self._lock:
+            self._expire(now)
+            for sampled_at, sample_route, _, functions in self._samples:
+                if now - sampled_at > window or (route and sample_route != route):
+                    continue
+                n_samples += 1
+                for name, (nc, tt, ct) in functions.items():
+                    total = totals[name]
+                    total[0] += nc
+                    total[1] += tt
+                    total[2] += ct
+
+        ranked = sorted(totals.items(), key=lambda item: item[1][1], reverse=True)[:limit]
+        return {
+            # 只含處理這個請求的 worker 所取樣的請求
+            "pid": os.getpid(),
+            "samples": n_samples,
+            "window_seconds": window,
+            "functions": [
+                {
+                    "function": name,
+                    "calls": nc,
+                    "tottime_ms": round(tt * 1000, 3),
+                    "cumtime_ms": round(ct * 1000, 3),
+                    "tottime_ms_per_request": round(tt * 1000 / n_samples, 3),
+                }
+                for name, (nc, tt, ct) in ranked
+            ],
+        }
+
+    def slow_profiles(self, limit=20):
+        if not os.path.isdir(self.profile_dir):
+            return []
+        files = sorted(
+            (f for f in os.listdir(self.profile_dir) if f.endswith(".prof")),
+            key=lambda f: os.path.getmtime(os.path.join(self.profile_dir, f)),
+            reverse=True,
+        )
+        return files[:limit]
+
+    def status(self):
+        self._settings_checked_at = 0.0
+        self._sync_settings()
+        with self._lock:
+            counts = dict(self.counts)
+        return {
+            "pid": os.getpid(),
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "slow_ms": self.slow_ms,
+            "profile_dir": self.profile_dir,
+            "window_seconds": self.window_seconds,
+            **counts,
+        }
+
+
+def render_profile_text(path, limit=30, sort="cumulative"):
+    """把存檔的 profile 轉成 pstats 文字報表"""
+    buffer = io.StringIO()
+    pstats.Stats(path, stream=buffer).sort_stats(sort).print_stats(limit)
+    return buffer.getvalue()
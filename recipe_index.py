@@ -0,0 +1,340 @@
+import logging
+import re
+import threading
+import time
+from collections import defaultdict
+
+# ============= 食材 → 食譜 反向索引 ===============
+# 啟動時把 main_recipe / recipe_steps / basic_vege 讀進記憶體，
+# 為每個食譜整理出它用到的蔬菜（所屬 vege_id 加上標題與步驟中出現的蔬菜名稱），
+# 並建立「食材 → 食譜 id 集合」的 posting list。
+# 使用者輸入冰箱裡的食材後，只需要對 posting list 做集合運算，
+# 不必每次都對資料庫下 LIKE 查詢。
+#
+# 文字中的蔬菜以「最長詞優先」斷詞並吃掉整段，「洋蔥」不會再多算一個「蔥」、「玉米筍」不會算成「玉米」；
+# 常見別名（蒜頭、胡蘿蔔、番茄…）對應回 basic_vege 的名稱。
+#
+# 每個 worker 各有一份索引：查詢前呼叫 ensure_fresh()，索引為空時（例如啟動時資料庫還沒好）隔 retry_interval 秒重試，
+# 建好後每 check_interval 秒比對一次各食譜內容的 md5，新增、修改、刪除都會增量更新。
+
+logger = logging.getLogger(__name__)
+
+INGREDIENT_SEPARATOR_RE = re.compile(r"[\s,，、;；和跟與及]+")
+INGREDIENT_PREFIX_RE = re.compile(r"^(?:食材|現有食材)\s*[:：]\s*")
+
+DEFAULT_IMAGE_URL = "https://i.imgur.com/your-default-image.png"
+
+# 常見說法 -> basic_vege.vege_name；對應的名稱不在 basic_vege 時忽略
+INGREDIENT_ALIASES = {
+    "蒜頭": "蒜",
+    "大蒜": "蒜",
+    "蒜仁": "蒜",
+    "青蒜": "蒜苗",
+    "青蔥": "蔥",
+    "紅蔥": "紅蔥頭",
+    "生薑": "薑",
+    "老薑": "薑",
+    "嫩薑": "薑",
+    "胡蘿蔔": "紅蘿蔔",
+    "蘿蔔": "白蘿蔔",
+    "番茄": "牛番茄",
+    "蕃茄": "牛番茄",
+    "高麗菜心": "高麗菜",
+    "甘藍": "高麗菜",
+    "包心菜": "高麗菜",
+    "捲心菜": "高麗菜",
+    "綠花椰": "青花菜",
+    "綠花椰菜": "青花菜",
+    "西蘭花": "青花菜",
+    "白花椰": "花椰菜",
+    "白花椰菜": "花椰菜",
+    "蕹菜": "空心菜",
+    "番薯": "地瓜",
+    "甘薯": "地瓜",
+    "洋芋": "馬鈴薯",
+    "彩椒": "甜椒",
+    "節瓜": "櫛瓜",
+    "筊白筍": "茭白筍",
+    "芫荽": "香菜",
+    "羅勒": "九層塔",
+    "A菜": "大陸妹",
+}
+
+
+class RecipeIndex:
+    """以集合運算比對食材的食譜反向索引，支援增量更新"""
+
+    def __init__(self, connection_factory, check_interval=300, retry_interval=30):
+        self._connection_factory = connection_factory
+        self.check_interval = check_interval
+        self.retry_interval = retry_interval
+        self._lock = threading.Lock()
+        # 同一時間只有一個執行緒連資料庫更新索引
+        self._refresh_lock = threading.Lock()
+        self.vegetable_names = {}   # vege_id -> vege_name
+        self.recipes = {}           # recipe_id -> {'id', 'name', 'vege_id', 'steps', 'ingredients'}
+        self.postings = defaultdict(set)  # vege_name -> {recipe_id, ...}
+        self._terms = {}            # 蔬菜名稱或別名 -> vege_name
+        self._max_term_length = 0
+        self._digests = None        # recipe_id -> 內容 md5；None 表示索引尚未建立
+        self._checked_at = 0.0
+
+    # ---------- 建立索引 ----------
+    def _fetch_digests(self, cur, recipe_ids=None):
+        # 標題、主要蔬菜與所有步驟的 md5，任何一項修改都會改變
+        sql = """
+            SELECT mr.id, md5(concat_ws(
+                E'\\x1f', mr.recipe, mr.vege_id::text,
+                string_agg(rs.step_no::text || ':' || rs.description, E'\\x1f' ORDER BY rs.step_no)
+            ))
+            FROM main_recipe AS mr
+            LEFT JOIN recipe_steps AS rs ON mr.id = rs.recipe_id
+        """
+        params = ()
+        if recipe_ids is not None:
+            sql += " WHERE mr.id = ANY(%s)"
+            params = (list(recipe_ids),)
+        sql += " GROUP BY mr.id;"
+        cur.execute(sql, params)
+        return dict(cur.fetchall())
+
+    def _fetch_recipes(self, cur, recipe_ids=None):
+        sql = """
+            SELECT mr.id, mr.recipe, mr.vege_id, rs.step_no, rs.description
+            FROM main_recipe AS mr
+            LEFT JOIN recipe_steps AS rs ON mr.id = rs.recipe_id
+        """
+        params = ()
+        if recipe_ids is not None:
+            sql += " WHERE mr.id = ANY(%s)"
+            params = (list(recipe_ids),)
+        sql += " ORDER BY mr.id, rs.step_no;"
+        cur.execute(sql, params)
+
+        recipes = {}
+        for recipe_id, title, vege_id, step_no, description in cur.fetchall():
+            recipe = recipes.setdefault(recipe_id, {
+                "id": recipe_id,
+                "name": title,
+                "vege_id": vege_id,
+                "steps": [],
+            })
+            if description:
+                recipe["steps"].append(description)
+        return recipes
+
+    def _set_vocabulary(self, vegetable_names):
+        """呼叫前需持有 self._lock"""
+        self.vegetable_names = vegetable_names
+        names = set(vegetable_names.values())
+        terms = {name: name for name in names}
+        for alias, name in INGREDIENT_ALIASES.items():
+            if name in names and alias not in terms:
+                terms[alias] = name
+        self._terms = terms
+        self._max_term_length = max(map(len, terms), default=0)
+
+    def _segment(self, text):
+        """最長詞優先斷詞，回傳 ([vege_name, ...], 被蔬菜名稱涵蓋的字數)"""
+        found, covered = [], 0
+        i = 0
+        while i < len(text):
+            for length in range(min(self._max_term_length, len(text) - i), 0, -1):
+                name = self._terms.get(text[i:i + length])
+                if name is not None:
+                    found.append(name)
+                    covered += length
+                    i += length
+                    break
+            else:
+                i += 1
+        return found, covered
+
+    def _extract_ingredients(self, recipe):
+        ingredients = set()
+        main_vege = self.vegetable_names.get(recipe["vege_id"])
+        if main_vege:
+            ingredients.add(main_vege)
+        found, _ = self._segment(recipe["name"] + "\n" + "\n".join(recipe["steps"]))
+        ingredients.update(found)
+        return frozenset(ingredients)
+
+    def _add(self, recipe):
+        recipe["ingredients"] = self._extract_ingredients(recipe)
+        self.recipes[recipe["id"]] = recipe
+        for ingredient in recipe["ingredients"]:
+            self.postings[ingredient].add(recipe["id"])
+
+    def _remove(self, recipe_id):
+        recipe = self.recipes.pop(recipe_id, None)
+        if recipe is None:
+            return
+        for ingredient in recipe["ingredients"]:
+            posting = self.postings.get(ingredient)
+            if posting is not None:
+                posting.discard(recipe_id)
+                if not posting:
+                    del self.postings[ingredient]
+
+    def _rebuild(self):
+        conn = self._connection_factory()
+        if conn is None:
+            return False
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT id, vege_name FROM basic_vege;")
+            vegetable_names = dict(cur.fetchall())
+            recipes = self._fetch_recipes(cur)
+            digests = self._fetch_digests(cur)
+            cur.close()
+        finally:
+            conn.close()
+
+        with self._lock:
+            self._set_vocabulary(vegetable_names)
+            self.recipes = {}
+            self.postings = defaultdict(set)
+            for recipe in recipes.values():
+                self._add(recipe)
+            self._digests = digests
+        return True
+
+    def _update(self, recipe_ids, cur):
+        recipes = self._fetch_recipes(cur, recipe_ids=recipe_ids)
+        digests = self._fetch_digests(cur, recipe_ids=recipe_ids)
+        with self._lock:
+            for recipe_id in recipe_ids:
+                self._remove(recipe_id)
+                self._digests.pop(recipe_id, None)
+            for recipe in recipes.values():
+                self._add(recipe)
+            self._digests.update(digests)
+
+    def _refresh(self):
+        self._checked_at = time.monotonic()
+        if self._digests is None:
+            return self._rebuild()
+
+        conn = self._connection_factory()
+        if conn is None:
+            return False
+        try:
+            cur = conn.cursor()
+            digests = self._fetch_digests(cur)
+            changed = {rid for rid, digest in digests.items() if self._digests.get(rid) != digest}
+            changed |= set(self._digests) - set(digests)
+            if changed:
+                self._update(changed, cur)
+            cur.close()
+        finally:
+            conn.close()
+        if changed:
+            logger.info(f"食譜索引已更新 {len(changed)} 筆食譜")
+        return True
+
+    def rebuild(self):
+        """完整重建索引"""
+        with self._refresh_lock:
+            self._checked_at = time.monotonic()
+            return self._rebuild()
+
+    def update_recipes(self, recipe_ids):
+        """只重新索引指定的食譜（新增、修改或刪除後呼叫），無法連接資料庫時回傳 False"""
+        recipe_ids = set(recipe_ids)
+        if not recipe_ids:
+            return True
+        with self._refresh_lock:
+            if self._digests is None:
+                return self._rebuild()
+            conn = self._connection_factory()
+            if conn is None:
+                return False
+            try:
+                cur = conn.cursor()
+                self._update(recipe_ids, cur)
+                cur.close()
+            finally:
+                conn.close()
+        return True
+
+    def refresh(self):
+        """比對各食譜內容的 md5，只重新索引新增、修改或刪除的食譜；尚未建立時完整建立"""
+        with self._refresh_lock:
+            return self._refresh()
+
+    def ensure_fresh(self):
+        """
+        查詢前呼叫：距離上次檢查超過間隔才連資料庫，已有其他執行緒在更新時直接使用目前的索引。
+        索引尚未建立時以較短的 retry_interval 重試。
+        """
+        interval = self.retry_interval if self._digests is None else self.check_interval
+        if time.monotonic() - self._checked_at < interval:
+            return
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            self._refresh()
+        except Exception as e:
+            logger.error(f"食譜索引更新失敗: {e}")
+        finally:
+            self._refresh_lock.release()
+
+    # ---------- 查詢 ----------
+    def resolve_ingredients(self, text):
+        """
+        把使用者輸入拆成已知的蔬菜名稱（別名換成正式名稱），回傳 (認得的食材, 認不得的字詞)。
+        每段字詞整段都能斷成蔬菜名稱才算認得，例如「高麗菜蒜頭」-> 高麗菜、蒜。
+        """
+        text = INGREDIENT_PREFIX_RE.sub("", text.strip())
+        known, unknown = [], []
+        for token in INGREDIENT_SEPARATOR_RE.split(text):
+            if not token:
+                continue
+            found, covered = self._segment(token)
+            if found and covered == len(token):
+                known.extend(name for name in found if name not in known)
+            else:
+                unknown.append(token)
+        return known, unknown
+
+    def search(self, ingredients, limit=10):
+        """
+        依覆蓋率排序食譜：
+        先比命中的食材數，再比食譜所需食材中被覆蓋的比例。
+        """
+        user_ingredients = set(ingredients)
+        with self._lock:
+            candidate_ids = set()
+            for ingredient in user_ingredients:
+                candidate_ids |= self.postings.get(ingredient, set())
+
+            scored = []
+            for recipe_id in candidate_ids:
+                recipe = self.recipes[recipe_id]
+                matched = recipe["ingredients"] & user_ingredients
+                coverage = len(matched) / len(recipe["ingredients"])
+                scored.append((len(matched), coverage, recipe_id, recipe, matched))
+
+        scored.sort(key=lambda item: (-item[0], -item[1], item[2]))
+        results = []
+        for matched_count, coverage, recipe_id, recipe, matched in scored[:limit]:
+            missing = sorted(recipe["ingredients"] - user_ingredients)
+            results.append({
+                "id": recipe_id,
+                "name": recipe["name"],
+                "description": f"使用食材：{'、'.join(sorted(matched))}"
+                + (f"\n還需要：{'、'.join(missing)}" if missing else ""),
+                "image_url": DEFAULT_IMAGE_URL,
+                "steps": recipe["steps"],
+                "matched": sorted(matched),
+                "missing": missing,
+                "coverage": round(coverage, 3),
+            })
+        return results
+
+    def is_ingredient_list(self, text):
+        """以「食材：」開頭，或輸入兩種以上且全部都是已知蔬菜時，視為食材清單"""
+        if INGREDIENT_PREFIX_RE.match(text.strip()):
+            return True
+        known, unknown = self.resolve_ingredients(text)
+        return len(known) >= 2 and not unknown
@@ -0,0 +1,117 @@
+# ============= 食譜關鍵字搜尋 ===============
+# 搭配 init/90_recipe_search.sql 建立的索引：
+# 標題與步驟各自篩選（可走索引），再以 word_similarity 排序，
+# 標題命中的權重較高，同一食譜多個步驟命中會累加分數。
+#
+# pg_trgm 無法從少於 3 個字的片段取出 trigram，「番茄」「豆腐」這類 2 字查詢
+# 用 ILIKE 時 GIN 索引幫不上忙（等同全表掃描再 recheck）。
+# 因此少於 MIN_TRIGRAM_LENGTH 個字的查詢改用 recipe_bigrams() 的 tsvector 索引：
+# 每個位置取 2 個字（最後一個字單獨一個 token），2 字查詢比對整個 token，1 字查詢用前綴比對。
+
+TITLE_WEIGHT = 2.0
+MAX_PER_PAGE = 50
+MIN_TRIGRAM_LENGTH = 3
+
+_SEARCH_SQL_TEMPLATE = """
+    WITH hits AS (
+        SELECT id AS recipe_id,
+               word_similarity(%(q)s, recipe) * %(title_weight)s AS score,
+               NULL::text AS snippet
+        FROM main_recipe
+        WHERE {title_match}
+        UNION ALL
+        SELECT recipe_id,
+               word_similarity(%(q)s, description) AS score,
+               description AS snippet
+        FROM recipe_steps
+        WHERE {step_match}
+    ),
+    matched AS (
+        SELECT mr.id, mr.recipe, mr.vege_id, r.score, r.snippet
+        FROM (
+            SELECT recipe_id, SUM(score) AS score, MIN(snippet) AS snippet
+            FROM hits
+            GROUP BY recipe_id
+        ) AS r
+        JOIN main_recipe AS mr ON mr.id = r.recipe_id
+    )
+    -- total 與分頁無關：超過最後一頁時仍回傳一列（其餘欄位為 NULL）帶出總筆數
+    SELECT p.id, p.recipe, p.vege_id, p.score, p.snippet, t.total
+    FROM (SELECT COUNT(*) AS total FROM matched) AS t
+    LEFT JOIN LATERAL (
+        SELECT * FROM matched
+        ORDER BY score DESC, id
+        LIMIT %(limit)s OFFSET %(offset)s
+    ) AS p ON true
+    ORDER BY p.score DESC, p.id;
+"""
+
+# 3 字以上：pg_trgm GIN 索引
+SEARCH_SQL = _SEARCH_SQL_TEMPLATE.format(
+    title_match="recipe ILIKE %(pattern)s",
+    step_match="description ILIKE %(pattern)s",
+)
+
+# 1～2 字：recipe_bigrams() 的 GIN 索引
+SHORT_SEARCH_SQL = _SEARCH_SQL_TEMPLATE.format(
+    title_match="recipe_bigrams(recipe) @@ %(tsquery)s::tsquery",
+    step_match="recipe_bigrams(description) @@ %(tsquery)s::tsquery",
+)
+
+# 對照組：不分數、不走索引的 ILIKE 全表掃描，僅供 benchmarks/recipe_search.py 比較
+NAIVE_SEARCH_SQL = """
+    SELECT DISTINCT mr.id, mr.recipe, mr.vege_id
+    FROM main_recipe AS mr
+    LEFT JOIN recipe_steps AS rs ON mr.id = rs.recipe_id
+    WHERE mr.recipe ILIKE %(pattern)s OR rs.description ILIKE %(pattern)s
+    ORDER BY mr.id
+    LIMIT %(limit)s OFFSET %(offset)s;
+"""
+
+
+def escape_like(text):
+    """跳脫 LIKE 的萬用字元，避免使用者輸入 % 或 _ 變成萬用比對"""
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def bigram_tsquery(query):
+    """把 1～2 字的查詢轉成比對 recipe_bigrams() 的 tsquery 字面值（不經過文字解析器）"""
+    lexeme = query.lower().replace("\\", "\\\\").replace("'", "''")
+    return f"'{lexeme}'" if len(query) > 1 else f"'{lexeme}':*"
+
+
+def clamp_paging(page, per_page):
+    """page 至少為 1，per_page 介於 1 與 MAX_PER_PAGE 之間；回應中的分頁值也應使用這組"""
+    return max(1, page), max(1, min(per_page, MAX_PER_PAGE))
+
+
+def search_recipes(cur, query, page=1, per_page=10):
+    """
+    以關鍵字搜尋食譜標題與步驟，回傳 (結果清單, 總筆數)。
+    page 與 per_page 先經過 clamp_paging。
+    """
+    page, per_page = clamp_paging(page, per_page)
+    short = len(query) < MIN_TRIGRAM_LENGTH
+    cur.execute(SHORT_SEARCH_SQL if short else SEARCH_SQL, {
+        "q": query,
+        "pattern": f"%{escape_like(query)}%",
+        "tsquery": bigram_tsquery(query) if short else None,
+        "title_weight": TITLE_WEIGHT,
+        "limit": per_page,
+        "offset": (page - 1) * per_page,
+    })
+    rows = cur.fetchall()
+
+    total = rows[0][5] if rows else 0
+    results = [
+        {
+            "id": recipe_id,
+            "title": title,
+            "vege_id": vege_id,
+            "score": round(float(score), 4),
+            "snippet": snippet,
+        }
+        for recipe_id, title, vege_id, score, snippet, _ in rows
+        if recipe_id is not None
+    ]
+    return results, total
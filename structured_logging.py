@@ -0,0 +1,204 @@
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from logging.handlers import QueueHandler, QueueListener
+
+# ============= 結構化日誌 ===============
+# - 每筆日誌輸出成一行 JSON，帶 correlation_id（每個 HTTP 請求 / LINE 事件一個）
+# - 呼叫端只把 record 丟進有上限的佇列，由背景執行緒寫 stdout；佇列滿時丟棄並計數，
+#   不讓日誌 I/O 卡住 webhook
+# - payload 一律經過 redact_payload：遮蔽 replyToken、userId 等欄位並截斷長度
+# - DEBUG 日誌依 LOG_DEBUG_SAMPLE_RATE 取樣
+# 設定：LOG_LEVEL（預設 INFO）、LOG_FORMAT（json / text）、LOG_QUEUE_SIZE、
+#       LOG_PAYLOAD_MAX（預設 2048 字元）、LOG_DEBUG_SAMPLE_RATE（預設 0.1）
+
+correlation_id_var = contextvars.ContextVar("correlation_id", default=None)
+
+PAYLOAD_MAX = int(os.getenv("LOG_PAYLOAD_MAX", 2048))
+REDACTED_FIELDS = ("replyToken", "userId", "groupId", "roomId", "nonce", "signature")
+REDACT_RE = re.compile(r'"({})"\s*:\s*"[^"]*"'.format("|".join(REDACTED_FIELDS)))
+
+# LogRecord 內建屬性，其餘透過 extra= 傳入的欄位會一併輸出
+_RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {
+    "message", "asctime", "correlation_id",
+}
+
+
+def new_correlation_id(value=None):
+    """設定目前 context 的 correlation id，回傳 token 以便結束時 reset"""
+    return correlation_id_var.set(value or uuid.uuid4().hex[:16])
+
+
+def reset_correlation_id(token):
+    correlation_id_var.reset(token)
+
+
+def redact_payload(text, limit=None):
+    """遮蔽敏感欄位並截斷，給日誌使用"""
+    limit = PAYLOAD_MAX if limit is None else limit
+    if text is None:
+        return None
+    redacted = REDACT_RE.sub(lambda m: f'"{m.group(1)}":"***"', text)
+    if len(redacted) > limit:
+        return f"{redacted[:limit]}...(truncated, {len(redacted)} chars)"
+    return redacted
+
+
+class CorrelationIdFilter(logging.Filter):
+    """在呼叫端的執行緒把 correlation id 寫進 record（背景執行緒看不到 contextvar）"""
+
+    def filter(self, record):
+        record.correlation_id = correlation_id_var.get()
+        return True
+
+
+class DebugSamplingFilter(logging.Filter):
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        return random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created))
+            + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "correlation_id", None):
+            entry["correlation_id"] = record.correlation_id
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            # 經過 NonBlockingQueueHandler.prepare 的 record 只留下字串
+            entry["exc_info"] = record.exc_text
+        if record.stack_info:
+            entry["stack_info"] = record.stack_info
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s - %(name)s - %(levelname)s - [%(correlation_id)s] %(message)s")
+
+
+class _DrainingQueueListener(QueueListener):
+    def enqueue_sentinel(self):
+        # 佇列滿時等 listener 消化，確保結束前已排入的日誌都會寫出
+        self.queue.put(self._sentinel, timeout=5)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    佇列滿時丟棄日誌而不是阻塞。
+    listener 執行緒依 pid 啟動，gunicorn fork 後每個 worker 會各自建立；
+    結束時 stop() 寫完佇列中的日誌，之後的日誌直接同步寫出。
+    """
+
+    def __init__(self, target_handler, queue_size, on_drop=None):
+        super().__init__(queue.Queue(maxsize=queue_size))
+        self.target_handler = target_handler
+        self.queue_size = queue_size
+        self.dropped = 0
+        # 每丟棄一筆呼叫一次，例如遞增 Prometheus counter
+        self.on_drop = on_drop
+        self._listener = None
+        self._pid = None
+        self._stopped_pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_listener(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            # fork 後繼承來的佇列可能有 master 的殘留，換一個新的
+            self.queue = queue.Queue(maxsize=self.queue_size)
+            self._listener = _DrainingQueueListener(self.queue, self.target_handler, respect_handler_level=True)
+            self._listener.start()
+            self._pid = os.getpid()
+
+    def prepare(self, record):
+        """
+        在呼叫端執行緒把訊息與 traceback 轉成字串（traceback 物件不適合跨執行緒保留），
+        但 traceback 另外放在 exc_text，formatter 才能輸出獨立的 exc_info 欄位，不混進 msg。
+        """
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = record.exc_text or logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        if self._stopped_pid == os.getpid():
+            self.target_handler.handle(record)
+            return
+        self._ensure_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            if self.on_drop is not None:
+                self.on_drop()
+
+    def stop(self):
+        """寫完佇列中的日誌並停止 listener；可重複呼叫"""
+        with self._start_lock:
+            if self._listener is None or self._pid != os.getpid() or self._stopped_pid == os.getpid():
+                return
+            self._stopped_pid = os.getpid()
+        try:
+            self._listener.stop()
+        except queue.Full:
+            pass
+
+
+def configure_logging(level=None, fmt=None, on_drop=None):
+    """
+    設定 root logger：所有 logger（含 app.logger 與各模組的 logging.getLogger(__name__)）
+    都經由同一個非阻塞佇列輸出。回傳 queue handler 以便查詢丟棄數；on_drop 在佇列滿丟棄時呼叫。
+    """
+    level = level or os.getenv("LOG_LEVEL", "INFO")
+    fmt = fmt or os.getenv("LOG_FORMAT", "json")
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+
+    queue_handler = NonBlockingQueueHandler(
+        stream_handler, int(os.getenv("LOG_QUEUE_SIZE", 10000)), on_drop=on_drop
+    )
+    queue_handler.addFilter(CorrelationIdFilter())
+    queue_handler.addFilter(DebugSamplingFilter(float(os.getenv("LOG_DEBUG_SAMPLE_RATE", 0.1))))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    # atexit 依註冊的相反順序執行，之後才註冊的（例如 LINE 發送佇列的 drain）會先跑完
+    atexit.register(queue_handler.stop)
+    return queue_handler
@@ -0,0 +1,182 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+# ============= 使用者對話狀態與限流 ===============
+# 每位使用者一筆精簡狀態：最後辨識/查詢到的蔬菜，以及圖片辨識的 token bucket。
+# - 記憶體內以 LRU 保存（上限 max_users，超過 ttl 未活動即淘汰）
+# - 可選 Postgres 持久化（表結構見 init/92_user_state.sql）：寫入時同步寫資料庫，讀取時以資料庫為準，
+#   多個 gunicorn worker 才看得到彼此寫入的蔬菜（以 gunicorn.conf.py 啟動且 workers > 1 時預設啟用）；
+#   資料庫讀不到時才用記憶體中的值。token bucket 只存在記憶體，多 worker 時各自限流
+# 讓「食譜」這類後續訊息可以直接沿用上一次的結果，不必重新查詢名稱或推論。
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    __slots__ = ("capacity", "refill_per_second", "tokens", "updated_at")
+
+    def __init__(self, capacity, refill_per_second, now=None):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = float(capacity)
+        self.updated_at = now if now is not None else time.monotonic()
+
+    def consume(self, now=None):
+        """取一個 token，回傳 (是否允許, 還要等幾秒)"""
+        now = now if now is not None else time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_per_second)
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True, 0.0
+        return False, (1 - self.tokens) / self.refill_per_second
+
+
+class UserState:
+    __slots__ = ("last_vege_name", "last_vege_id", "image_bucket", "touched_at")
+
+    def __init__(self, last_vege_name=None, last_vege_id=None):
+        self.last_vege_name = last_vege_name
+        self.last_vege_id = last_vege_id
+        self.image_bucket = None
+        self.touched_at = time.monotonic()
+
+
+class PostgresUserStatePersistence:
+    def __init__(self, connection_factory):
+        self._connection_factory = connection_factory
+
+    def load(self, user_id):
+        conn = self._connection_factory()
+        if conn is None:
+            return None
+        try:
+            cur = conn.cursor()
+            cur.execute(
+                "SELECT last_vege_name, last_vege_id FROM user_state WHERE user_id = %s;",
+                (user_id,),
+            )
+            row = cur.fetchone()
+            cur.close()
+            return UserState(*row) if row else None
+        except Exception as e:
+            logger.error(f"讀取 user_state 失敗: {e}")
+            return None
+        finally:
+            conn.close()
+
+    def save(self, user_id, state):
+        conn = self._connection_factory()
+        if conn is None:
+            return
+        try:
+            with conn:
+                cur = conn.cursor()
+                cur.execute(
+                    """
+                    INSERT INTO user_state (user_id, last_vege_name, last_vege_id, updated_at)
+                    VALUES (%s, %s, %s, now())
+                    ON CONFLICT (user_id) DO UPDATE SET
+                        last_vege_name = EXCLUDED.last_vege_name,
+                        last_vege_id = EXCLUDED.last_vege_id,
+                        updated_at = now();
+                    """,
+                    (user_id, state.last_vege_name, state.last_vege_id),
+                )
+                cur.close()
+        except Exception as e:
+            logger.error(f"寫入 user_state 失敗: {e}")
+        finally:
+            conn.close()
+
+
+class UserStateStore:
+    def __init__(
+        self,
+        max_users=10000,
+        ttl=86400,
+        image_burst=3,
+        image_per_minute=6,
+        persistence=None,
+    ):
+        self.max_users = max_users
+        self.ttl = ttl
+        self.image_burst = image_burst
+        self.image_refill_per_second = image_per_minute / 60.0
+        self.persistence = persistence
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+        self.throttled = 0
+
+    def _get_or_create(self, user_id, now):
+        """呼叫前需持有 self._lock"""
+        state = self._states.get(user_id)
+        if state is not None and now - state.touched_at > self.ttl:
+            del self._states[user_id]
+            state = None
+        if state is None:
+            state = UserState()
+            self._states[user_id] = state
+            while len(self._states) > self.max_users:
+                self._states.popitem(last=False)
+        else:
+            self._states.move_to_end(user_id)
+        state.touched_at = now
+        return state
+
+    def get(self, user_id):
+        """
+        取得使用者狀態。有設定 Postgres 時以資料庫為準（其他 worker 可能剛更新過），
+        沒有紀錄或資料庫錯誤時才用記憶體中的值。
+        """
+        if not user_id:
+            return None
+        # 資料庫查詢不持有鎖
+        loaded = self.persistence.load(user_id) if self.persistence is not None else None
+        now = time.monotonic()
+        with self._lock:
+            if loaded is None:
+                state = self._states.get(user_id)
+                if state is None or now - state.touched_at > self.ttl:
+                    return None
+                self._states.move_to_end(user_id)
+                return state
+            state = self._get_or_create(user_id, now)
+            # 名稱與 id 一起換掉，不會拼出兩種不同的蔬菜
+            state.last_vege_name, state.last_vege_id = loaded.last_vege_name, loaded.last_vege_id
+            return state
+
+    def remember_vegetable(self, user_id, vege_name, vege_id=None):
+        if not user_id:
+            return
+        with self._lock:
+            state = self._get_or_create(user_id, time.monotonic())
+            state.last_vege_name = vege_name
+            state.last_vege_id = vege_id
+        if self.persistence is not None:
+            self.persistence.save(user_id, state)
+
+    def allow_image(self, user_id):
+        """圖片辨識限流，回傳 (是否允許, 建議等待秒數)"""
+        if not user_id:
+            return True, 0.0
+        now = time.monotonic()
+        with self._lock:
+            state = self._get_or_create(user_id, now)
+            if state.image_bucket is None:
+                state.image_bucket = TokenBucket(self.image_burst, self.image_refill_per_second, now)
+            allowed, retry_after = state.image_bucket.consume(now)
+            if not allowed:
+                self.throttled += 1
+            return allowed, retry_after
+
+    def stats(self):
+        with self._lock:
+            return {
+                "users": len(self._states),
+                "max_users": self.max_users,
+                "image_throttled": self.throttled,
+                "persistence": type(self.persistence).__name__ if self.persistence else None,
+            }